@@ -0,0 +1,168 @@
+"""Micro-benchmark for clean_html, checked against the original implementation.
+
+Run from the addon root:
+
+    python -m bench.clean_html [--repeat N]
+"""
+import argparse
+import re
+import sys
+import timeit
+
+from resources.lib.text import clean_html
+
+
+def legacy_clean_html(text):
+    """clean_html as shipped before the single-pass rewrite, kept as the reference"""
+    if not text:
+        return ''
+    
+    # Remove image tags and their content completely
+    text = re.sub(r'<img[^>]*>', '', text, flags=re.IGNORECASE)
+    
+    # Remove other problematic tags that might contain unwanted content
+    text = re.sub(r'<script[^>]*>.*?</script>', '', text, flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r'<style[^>]*>.*?</style>', '', text, flags=re.IGNORECASE | re.DOTALL)
+    
+    # Convert common HTML formatting to plain text equivalents
+    text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'<p[^>]*>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'</p>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'<div[^>]*>', '\n', text, flags=re.IGNORECASE)
+    text = re.sub(r'</div>', '\n', text, flags=re.IGNORECASE)
+    
+    # Remove all remaining HTML tags
+    text = re.sub(r'<[^>]+>', '', text)
+    
+    # Decode HTML entities (more comprehensive list)
+    html_entities = {
+        '&amp;': '&',
+        '&lt;': '<',
+        '&gt;': '>',
+        '&quot;': '"',
+        '&apos;': "'",
+        '&nbsp;': ' ',
+        '&#39;': "'",
+        '&mdash;': '—',
+        '&ndash;': '–',
+        '&hellip;': '...',
+        '&ldquo;': '"',
+        '&rdquo;': '"',
+        '&lsquo;': "'",
+        '&rsquo;': "'",
+        '&bull;': '•',
+        '&copy;': '©',
+        '&reg;': '®',
+        '&trade;': '™'
+    }
+    
+    for entity, char in html_entities.items():
+        text = text.replace(entity, char)
+    
+    # Handle numeric HTML entities (like &#8217;)
+    text = re.sub(r'&#(\d+);', lambda m: chr(int(m.group(1))) if int(m.group(1)) < 65536 else '', text)
+    
+    # Clean up extra whitespace and newlines
+    text = re.sub(r'\n\s*\n', '\n\n', text)  # Multiple newlines to double newline
+    text = re.sub(r'[ \t]+', ' ', text)  # Multiple spaces/tabs to single space
+    text = text.strip()
+    
+    return text
+
+
+# Inputs both implementations must render identically
+GOLDEN = [
+    '',
+    'Plain text, no markup.',
+    '<p>First paragraph.</p><p>Second &amp; last.</p>',
+    'Line one<br>Line two<BR/>Line three<br />',
+    '<div class="x">Block</div>   <div>Next</div>',
+    '<img src="cover.jpg" alt="cover">Caption &mdash; here',
+    '<script type="text/javascript">var a = "<b>";</script>After script',
+    '<STYLE>p { color: red; }</STYLE><b>Bold</b> and <i>italic</i>',
+    'Quotes: &ldquo;hi&rdquo; &lsquo;there&rsquo; &quot;x&quot; &#39;y&#39; &apos;z&apos;',
+    'Symbols: &copy; &reg; &trade; &bull; &ndash; &hellip;',
+    'Non&nbsp;breaking&nbsp;&nbsp;spaces\t\tand tabs',
+    'Numeric: &#8217; &#8220;quoted&#8221; &#169; &#128512; end',
+    'Escaped tags: &lt;b&gt;not bold&lt;/b&gt;',
+    '<p>\n\n\n  Lots   of\n\n \n whitespace  </p>\n\n',
+    '<a href="https://example.com/?a=1&b=2">Link</a> text',
+    '<ul><li>One</li><li>Two</li></ul>',
+    '   <p>Leading and trailing</p>   ',
+    'Ages 8 < 12<br>Great book',
+    'Chapter 1 <3 this<p>More</p>',
+    'a < b<div>c</div> <3<br/>end',
+]
+
+# Inputs where the rewrite intentionally differs (full html.unescape semantics)
+CHANGED = [
+    ('Caf&eacute; &euro;5', 'Café €5'),
+    ('Hex &#x2019; entity', 'Hex \u2019 entity'),
+    ('Double &amp;lt;escaped&amp;gt;', 'Double &lt;escaped&gt;'),
+]
+
+
+def sample_description(i):
+    return (
+        f'<p>Episode {i}: in which our hosts discuss &ldquo;things&rdquo; &amp; more.</p>'
+        '<p>Sponsored by <a href="https://example.com">Example</a> &mdash; use code '
+        '<b>SHELF</b> for 20&#37; off.</p><br/><img src="https://example.com/x.png">'
+        '<ul><li>Topic one&hellip;</li><li>Topic two</li></ul>'
+        '<p>Music by Someone&nbsp;Else. &copy; 2024</p>'
+    )
+
+
+def check_golden():
+    failures = 0
+    samples = GOLDEN + [sample_description(i) for i in range(3)]
+    for text in samples:
+        expected = legacy_clean_html(text)
+        actual = clean_html(text)
+        if actual != expected:
+            failures += 1
+            print(f'MISMATCH {text!r}\n  legacy: {expected!r}\n  new:    {actual!r}')
+    for text, expected in CHANGED:
+        actual = clean_html(text)
+        if actual != expected:
+            failures += 1
+            print(f'MISMATCH {text!r}\n  expected: {expected!r}\n  new:      {actual!r}')
+    total = len(samples) + len(CHANGED)
+    print(f'golden: {total - failures}/{total} match')
+    return failures == 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--episodes', type=int, default=2000)
+    args = parser.parse_args()
+
+    if not check_golden():
+        return 1
+
+    # Distinct descriptions, as in a 2,000-episode podcast
+    texts = [sample_description(i) for i in range(args.episodes)]
+
+    def run_legacy():
+        for text in texts:
+            legacy_clean_html(text)
+
+    def run_uncached():
+        clean_html.cache_clear()
+        for text in texts:
+            clean_html.__wrapped__(text)
+
+    def run_cached():
+        for text in texts:
+            clean_html(text)
+
+    clean_html.cache_clear()
+    run_cached()
+    for name, func in (('legacy', run_legacy), ('uncached', run_uncached), ('memoized', run_cached)):
+        best = min(timeit.repeat(func, number=1, repeat=args.repeat))
+        print(f'{name:12} {best * 1000:8.1f} ms  ({best / len(texts) * 1e6:6.1f} us/item)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
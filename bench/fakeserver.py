@@ -0,0 +1,418 @@
+"""Local stand-in for an Audiobookshelf server serving synthetic libraries.
+
+Can also be run on its own for manual testing:
+
+    python -m bench.fakeserver --books 10000 --podcasts 20 --episodes 5000 --latency 30
+"""
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+import urllib.parse
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKEN = 'bench-token'
+BOOK_LIBRARY = 'lib-books'
+PODCAST_LIBRARY = 'lib-podcasts'
+EPOCH_MS = 1600000000000
+
+DESCRIPTION = (
+    '<p>{title} is a story about <b>things</b> &amp; <i>other things</i>.</p>'
+    '<p>Read by the author&hellip; with &ldquo;feeling&rdquo;.</p><br/>'
+    '<img src="https://example.com/banner.png"><ul><li>One</li><li>Two</li></ul>'
+)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+        self.paths = []
+
+    def add(self, path, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes += size
+            self.paths.append(path)
+
+    def snapshot(self):
+        with self.lock:
+            return {'requests': self.requests, 'bytes': self.bytes, 'paths': list(self.paths)}
+
+
+class Library:
+    """Deterministic synthetic library data, generated on demand"""
+
+    def __init__(self, books=1000, podcasts=20, episodes=500, audio_files=1):
+        self.books = books
+        self.podcasts = podcasts
+        self.episodes = episodes
+        self.audio_files = audio_files
+
+    def libraries(self):
+        return {'libraries': [
+            {'id': BOOK_LIBRARY, 'name': 'Audiobooks', 'mediaType': 'book'},
+            {'id': PODCAST_LIBRARY, 'name': 'Podcasts', 'mediaType': 'podcast'},
+        ]}
+
+    def book(self, i, expanded=False):
+        title = f'Book {i:05d}'
+        duration = 3600 * (1 + i % 20) + i % 60
+        item = {
+            'id': f'book-{i}',
+            'libraryId': BOOK_LIBRARY,
+            'mediaType': 'book',
+            'addedAt': EPOCH_MS + i * 60000,
+            'updatedAt': EPOCH_MS + i * 60000,
+            'media': {
+                'metadata': {
+                    'title': title,
+                    'authorName': f'Author {i % 97}',
+                    'narratorName': f'Narrator {i % 31}',
+                    'seriesName': f'Series {i % 13}' if i % 3 else '',
+                    'genres': ['Fiction', 'Fantasy'] if i % 2 else ['Non-fiction'],
+                    'description': DESCRIPTION.format(title=title),
+                    'publishedYear': str(1950 + i % 70),
+                },
+                'duration': duration,
+                'numTracks': self.audio_files,
+            },
+        }
+        if expanded:
+            part = duration / self.audio_files
+            item['media']['audioFiles'] = [
+                {'index': n + 1, 'ino': f'{i}{n:04d}', 'duration': part,
+                 'metadata': {'filename': f'part{n + 1}.mp3', 'size': int(part * 16000)}}
+                for n in range(self.audio_files)]
+            chapter_length = duration / max(10, self.audio_files)
+            item['media']['chapters'] = [
+                {'id': n, 'start': n * chapter_length, 'end': (n + 1) * chapter_length, 'title': f'Chapter {n + 1}'}
+                for n in range(max(10, self.audio_files))]
+        return item
+
+    def podcast(self, i, expanded=False):
+        title = f'Podcast {i:03d}'
+        item = {
+            'id': f'podcast-{i}',
+            'libraryId': PODCAST_LIBRARY,
+            'mediaType': 'podcast',
+            'addedAt': EPOCH_MS + i * 60000,
+            'updatedAt': EPOCH_MS + i * 60000,
+            'media': {
+                'metadata': {
+                    'title': title,
+                    'author': f'Host {i}',
+                    'genres': ['Technology'],
+                    'description': DESCRIPTION.format(title=title),
+                },
+                'numEpisodes': self.episodes,
+            },
+        }
+        if expanded:
+            item['media']['episodes'] = self.podcast_episodes(i)
+        return item
+
+    @lru_cache(maxsize=4)
+    def podcast_episodes(self, i):
+        return [{
+            'id': f'ep-{i}-{n}',
+            'libraryItemId': f'podcast-{i}',
+            'title': f'Episode {n}',
+            'description': DESCRIPTION.format(title=f'Episode {n}'),
+            'publishedAt': EPOCH_MS + n * 86400000,
+            'duration': 1800 + n % 1800,
+            'audioFile': {'ino': f'9{i:03d}{n:06d}', 'duration': 1800 + n % 1800,
+                          'metadata': {'size': (1800 + n % 1800) * 16000}},
+        } for n in range(self.episodes)]
+
+    def items(self, library_id, query):
+        if library_id == BOOK_LIBRARY:
+            total, make = self.books, self.book
+        elif library_id == PODCAST_LIBRARY:
+            total, make = self.podcasts, self.podcast
+        else:
+            return None
+
+        indexes = range(total)
+        if query.get('sort') == 'updatedAt' and query.get('desc') == '1':
+            indexes = reversed(indexes)
+        indexes = list(indexes)
+
+        limit = int(query.get('limit', 0) or 0)
+        page = int(query.get('page', 0) or 0)
+        if limit:
+            indexes = indexes[page * limit:(page + 1) * limit]
+        return {'results': [make(i) for i in indexes], 'total': total, 'limit': limit, 'page': page}
+
+    def personalized(self, library_id, query):
+        """Home shelves like GET /api/libraries/{id}/personalized: a few in progress, the newest additions"""
+        limit = int(query.get('limit', 10) or 10)
+        if library_id == BOOK_LIBRARY:
+            in_progress = [dict(self.book(i), progressLastUpdate=EPOCH_MS - i * 60000)
+                           for i in range(min(3, self.books))]
+            newest = [self.book(i) for i in reversed(range(max(self.books - limit, 0), self.books))]
+            return [
+                {'id': 'continue-listening', 'label': 'Continue Listening', 'type': 'book', 'entities': in_progress},
+                {'id': 'recently-added', 'label': 'Recently Added', 'type': 'book', 'entities': newest},
+            ]
+        if library_id == PODCAST_LIBRARY:
+            podcasts = range(min(limit, self.podcasts))
+            with_episode = lambda i, n: dict(self.podcast(i), recentEpisode=self.podcast_episodes(i)[n])
+            return [
+                {'id': 'continue-listening', 'label': 'Continue Listening', 'type': 'episode',
+                 'entities': [dict(with_episode(0, 1), progressLastUpdate=EPOCH_MS - 30000)] if self.podcasts else []},
+                {'id': 'newest-episodes', 'label': 'Newest Episodes', 'type': 'episode',
+                 'entities': [with_episode(i, self.episodes - 1) for i in podcasts]},
+                {'id': 'recently-added', 'label': 'Recently Added', 'type': 'podcast',
+                 'entities': [self.podcast(i) for i in reversed(podcasts)]},
+            ]
+        return None
+
+    def session(self, item_id, request):
+        """Playback session like POST /api/items/{id}/play; multi-file books transcode to HLS"""
+        item = self.item(item_id)
+        if item is None or item['mediaType'] != 'book':
+            return None
+        media = item['media']
+        session_id = f'session-{item_id}-{int(time.time() * 1000)}'
+        if len(media['audioFiles']) > 1 and request.get('forceTranscode'):
+            play_method = 2
+            tracks = [{'index': 1, 'startOffset': 0, 'duration': media['duration'], 'title': 'output.m3u8',
+                       'contentUrl': f'/hls/{session_id}/output.m3u8', 'mimeType': 'application/vnd.apple.mpegurl'}]
+        else:
+            play_method = 0
+            offsets = [sum(f['duration'] for f in media['audioFiles'][:n]) for n in range(len(media['audioFiles']))]
+            tracks = [{'index': f['index'], 'startOffset': offset, 'duration': f['duration'],
+                       'title': f['metadata']['filename'], 'mimeType': 'audio/mpeg',
+                       'contentUrl': f'/api/items/{item_id}/file/{f["ino"]}'}
+                      for f, offset in zip(media['audioFiles'], offsets)]
+        return {'id': session_id, 'libraryItemId': item_id, 'episodeId': None, 'mediaType': 'book',
+                'displayTitle': media['metadata']['title'], 'displayAuthor': media['metadata']['authorName'],
+                'duration': media['duration'], 'playMethod': play_method, 'currentTime': 0,
+                'chapters': media['chapters'], 'audioTracks': tracks}
+
+    def file_size(self, item_id, ino):
+        """Size an item's audio file claims in its metadata, so downloads can be checked against it"""
+        item = self.item(item_id)
+        if item is None:
+            return None
+        files = item['media'].get('audioFiles') or [ep['audioFile'] for ep in item['media'].get('episodes', [])]
+        return next((f['metadata']['size'] for f in files if f['ino'] == ino), None)
+
+    def item(self, item_id):
+        kind, _, index = item_id.rpartition('-')
+        if not index.isdigit():
+            return None
+        index = int(index)
+        if kind == 'book' and index < self.books:
+            return self.book(index, expanded=True)
+        if kind == 'podcast' and index < self.podcasts:
+            return self.podcast(index, expanded=True)
+        return None
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data).encode() if data is not None else b''
+        etag = '"%s"' % hashlib.md5(body).hexdigest()
+        if status == 200 and self.headers.get('If-None-Match') == etag:
+            status, body = 304, b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status in (200, 304):
+            self.send_header('ETag', etag)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.add(self.path, len(body))
+
+    def send_audio(self, size):
+        # Just enough of a file for Range handling; content is filler bytes
+        start, end = 0, size - 1
+        range_header = self.headers.get('Range', '')
+        status = 200
+        if range_header.startswith('bytes='):
+            first, _, last = range_header[6:].partition('-')
+            start = int(first or 0)
+            end = min(int(last), size - 1) if last else size - 1
+            status = 206
+        length = end - start + 1
+        self.send_response(status)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(length))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if self.command != 'HEAD':
+            chunk = b'\0' * 65536
+            remaining = length
+            while remaining > 0:
+                self.wfile.write(chunk[:remaining])
+                remaining -= len(chunk)
+        self.server.stats.add(self.path, length)
+
+    def send_image(self, width):
+        # Originals are large; resized covers shrink with the square of the width
+        size = min(width * width // 8, 2 * 1024 * 1024) if width else 2 * 1024 * 1024
+        body = b'\xff\xd8' + b'\0' * (size - 2)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        self.server.stats.add(self.path, len(body))
+
+    def send_playlist(self):
+        body = b'#EXTM3U\n#EXT-X-VERSION:3\n#EXT-X-TARGETDURATION:6\n#EXTINF:6.0,\n0.ts\n#EXT-X-ENDLIST\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.apple.mpegurl')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.add(self.path, len(body))
+
+    def authorized(self):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        return self.headers.get('Authorization') == f'Bearer {TOKEN}' or query.get('token') == TOKEN
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+    def do_POST(self):
+        time.sleep(self.server.latency)
+        path = urllib.parse.urlparse(self.path).path
+        body = self.read_body()
+        if path == '/login':
+            if body.get('username') and body.get('password'):
+                return self.send_json({'user': {'token': TOKEN}})
+            return self.send_json({'error': 'Invalid credentials'}, 401)
+        if not self.authorized():
+            return self.send_json(None, 401)
+        parts = path.strip('/').split('/')
+        if parts[:2] == ['api', 'items'] and len(parts) == 4 and parts[3] == 'play':
+            data = self.server.library.session(parts[2], body)
+            return self.send_json(data, 200 if data else 404)
+        if parts[:2] == ['api', 'session'] and len(parts) == 4 and parts[3] == 'close':
+            return self.send_json({})
+        return self.send_json(None, 404)
+
+    def do_PATCH(self):
+        time.sleep(self.server.latency)
+        path = urllib.parse.urlparse(self.path).path
+        body = self.read_body()
+        if not self.authorized():
+            return self.send_json(None, 401)
+        if path == '/api/me/progress/batch/update':
+            with self.server.stats.lock:
+                for update in body:
+                    key = (update['libraryItemId'], update.get('episodeId'))
+                    self.server.progress[key] = update
+            return self.send_json(None)
+        return self.send_json(None, 404)
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        parts = url.path.strip('/').split('/')
+        if not self.authorized():
+            return self.send_json(None, 401)
+
+        library = self.server.library
+        data = None
+        if parts[:2] == ['api', 'libraries'] and len(parts) == 2:
+            data = library.libraries()
+        elif parts[:2] == ['api', 'libraries'] and len(parts) == 4 and parts[3] == 'items':
+            data = library.items(parts[2], query)
+        elif parts[:2] == ['api', 'libraries'] and len(parts) == 4 and parts[3] == 'personalized':
+            data = library.personalized(parts[2], query)
+        elif parts[:2] == ['api', 'items'] and len(parts) == 3:
+            data = library.item(parts[2])
+        elif parts[:2] == ['api', 'items'] and len(parts) == 5 and parts[3] == 'file':
+            size = library.file_size(parts[2], parts[4])
+            return self.send_audio(size) if size else self.send_json(None, 404)
+        elif parts[:2] == ['api', 'items'] and len(parts) == 4 and parts[3] == 'cover':
+            return self.send_image(int(query.get('width') or 0))
+        elif parts[0] == 'hls' and len(parts) == 3:
+            return self.send_playlist()
+
+        if data is None:
+            return self.send_json(None, 404)
+        return self.send_json(data)
+
+    do_HEAD = do_GET
+
+
+class QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients dropping keep-alive connections is normal here
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class FakeServer:
+    """Runs the fake Audiobookshelf server on a background thread"""
+
+    def __init__(self, library, latency=0.0, host='127.0.0.1', port=0):
+        self.httpd = QuietServer((host, port), Handler)
+        self.httpd.library = library
+        self.httpd.latency = latency
+        self.httpd.stats = Stats()
+        self.httpd.progress = {}
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def stats(self):
+        return self.httpd.stats
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--books', type=int, default=1000)
+    parser.add_argument('--podcasts', type=int, default=20)
+    parser.add_argument('--episodes', type=int, default=500)
+    parser.add_argument('--audio-files', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=0, help='per-request latency in ms')
+    parser.add_argument('--port', type=int, default=13378)
+    args = parser.parse_args()
+
+    library = Library(args.books, args.podcasts, args.episodes, args.audio_files)
+    server = FakeServer(library, args.latency / 1000, port=args.port)
+    print(f'Serving on {server.url} (token: {TOKEN})')
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
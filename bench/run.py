@@ -0,0 +1,160 @@
+"""Benchmark plugin routes against the fake server, outside Kodi.
+
+Each route runs in a fresh Python process (as Kodi does for every plugin call)
+with the stand-in Kodi modules from bench/stubs. Run from the addon root:
+
+    python -m bench.run --books 10000 --episodes 5000 --latency 20
+    python -m bench.run --route episodes --setting cache_enabled=false --trace-memory
+
+Paint time runs from import until the listing (or resolved URL) is handed to
+Kodi; wall time covers the plugin module from import to exit, including work
+done after the listing is shown; process time adds interpreter startup. Requests and bytes are counted by the fake server.
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.fakeserver import BOOK_LIBRARY, PODCAST_LIBRARY, TOKEN, FakeServer, Library
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_DIR = os.path.join(ADDON_DIR, 'bench', 'stubs')
+
+ROUTES = {
+    'libraries': '',
+    'books': f'?action=library&id={BOOK_LIBRARY}&type=book',
+    'podcasts': f'?action=library&id={PODCAST_LIBRARY}&type=podcast',
+    'episodes': '?action=episodes&id=podcast-0',
+    'play_book': '?action=play&id=book-0&type=book',
+    'play_episode': '?action=play&id=podcast-0&episode=ep-0-0&type=podcast',
+}
+
+
+def run_child(args):
+    """Run one plugin invocation in this process and print its measurements as JSON"""
+    import runpy
+    import tracemalloc
+
+    sys.path.insert(0, STUBS_DIR)
+    sys.path.insert(0, ADDON_DIR)
+
+    import _recorder
+    import xbmcaddon
+    xbmcaddon.SETTINGS.update(json.loads(args.settings))
+    xbmcaddon.ADDON_INFO.update({'path': ADDON_DIR, 'profile': args.profile})
+
+    sys.argv = ['plugin://plugin.audio.audiobookshelf/', '1', args.query]
+    if args.trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    runpy.run_path(os.path.join(ADDON_DIR, 'main.py'), run_name='__main__')
+    wall = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    tracemalloc.stop()
+
+    paint = _recorder.marks.get('paint')
+    print(json.dumps({
+        'wall': wall,
+        'paint': paint - start if paint else None,
+        'peak_py': peak,
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        'items': len(_recorder.directory_items),
+        'resolved': len(_recorder.resolved),
+        'calls': dict(_recorder.calls),
+    }))
+
+
+def invoke(server, query, profile, settings, trace_memory=False):
+    before = server.stats.snapshot()
+    cmd = [sys.executable, '-m', 'bench.run', '--child', '--query', query,
+           '--profile', profile, '--settings', json.dumps(settings)]
+    if trace_memory:
+        cmd.append('--trace-memory')
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=ADDON_DIR, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f'route {query!r} failed')
+    if proc.stderr:
+        sys.stderr.write(proc.stderr)
+    after = server.stats.snapshot()
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['process'] = elapsed
+    result['requests'] = after['requests'] - before['requests']
+    result['bytes'] = after['bytes'] - before['bytes']
+    result['paths'] = after['paths'][len(before['paths']):]
+    return result
+
+
+def format_row(name, phase, result):
+    peak_py = f'{result["peak_py"] / 1048576:8.1f}' if result['peak_py'] is not None else f'{"-":>8}'
+    paint = f'{result["paint"] * 1000:9.1f}' if result['paint'] is not None else f'{"-":>9}'
+    return (f'{name:14} {phase:5} {paint} {result["wall"] * 1000:9.1f} {result["process"] * 1000:9.1f} '
+            f'{result["requests"]:6d} {result["bytes"] / 1024:9.1f} '
+            f'{peak_py} {result["max_rss"] / 1048576:8.1f} {result["items"]:6d}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--query', help=argparse.SUPPRESS)
+    parser.add_argument('--profile', help=argparse.SUPPRESS)
+    parser.add_argument('--settings', default='{}', help=argparse.SUPPRESS)
+
+    parser.add_argument('--route', action='append', choices=sorted(ROUTES),
+                        help='route to run (repeatable, default: all)')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--podcasts', type=int, default=20)
+    parser.add_argument('--episodes', type=int, default=5000)
+    parser.add_argument('--audio-files', type=int, default=1)
+    parser.add_argument('--latency', type=float, default=20, help='per-request latency in ms')
+    parser.add_argument('--setting', action='append', default=[], metavar='KEY=VALUE',
+                        help='override an addon setting (repeatable)')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='measure peak Python allocations with tracemalloc (slows the run)')
+    parser.add_argument('--no-warm', action='store_true', help='skip the second (warm profile) run')
+    parser.add_argument('--json', action='store_true', help='print raw results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='list the requests each run made')
+    args = parser.parse_args()
+
+    if args.child:
+        return run_child(args)
+
+    library = Library(args.books, args.podcasts, args.episodes, args.audio_files)
+    server = FakeServer(library, args.latency / 1000).start()
+    settings = {'server_url': server.url, 'username': 'bench', 'password': 'bench', 'api_token': TOKEN}
+    settings.update(dict(item.split('=', 1) for item in args.setting))
+
+    results = {}
+    print(f'{"route":14} {"run":5} {"paint ms":>9} {"wall ms":>9} {"proc ms":>9} {"reqs":>6} {"KiB in":>9} '
+          f'{"py MiB":>8} {"rss MiB":>8} {"items":>6}')
+    try:
+        for name in args.route or list(ROUTES):
+            profile = tempfile.mkdtemp(prefix='abs-bench-')
+            try:
+                phases = ('cold',) if args.no_warm else ('cold', 'warm')
+                for phase in phases:
+                    result = invoke(server, ROUTES[name], profile, settings, args.trace_memory)
+                    results.setdefault(name, {})[phase] = result
+                    print(format_row(name, phase, result))
+                    if args.verbose:
+                        for path in result['paths']:
+                            print(f'    {path}')
+            finally:
+                shutil.rmtree(profile, ignore_errors=True)
+    finally:
+        server.stop()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,26 @@
+"""Shared call log for the Kodi module stand-ins"""
+import time
+from collections import Counter
+
+calls = Counter()
+# perf_counter() timestamps of notable calls, e.g. when the listing was handed to Kodi
+marks = {}
+directory_items = []
+resolved = []
+log_lines = []
+
+
+def record(name):
+    calls[name] += 1
+
+
+def mark(name):
+    marks.setdefault(name, time.perf_counter())
+
+
+def reset():
+    calls.clear()
+    marks.clear()
+    del directory_items[:]
+    del resolved[:]
+    del log_lines[:]
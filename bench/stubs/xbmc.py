@@ -0,0 +1,105 @@
+"""Stand-in for Kodi's xbmc module that records calls"""
+import time
+
+from _recorder import log_lines, mark, record
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGWARNING = 2
+LOGERROR = 3
+LOGFATAL = 4
+LOGNONE = 5
+
+PLAYLIST_MUSIC = 0
+PLAYLIST_VIDEO = 1
+
+# Messages at or above this level are echoed to stderr
+LOG_ECHO_LEVEL = LOGWARNING
+
+
+def log(msg, level=LOGDEBUG):
+    record('xbmc.log')
+    log_lines.append((level, msg))
+    if level >= LOG_ECHO_LEVEL:
+        import sys
+        print(f'[xbmc.log {level}] {msg}', file=sys.stderr)
+
+
+def sleep(ms):
+    time.sleep(ms / 1000)
+
+
+def executebuiltin(function, wait=False):
+    record('xbmc.executebuiltin')
+
+
+def getInfoLabel(label):
+    record('xbmc.getInfoLabel')
+    return ''
+
+
+def getCondVisibility(condition):
+    record('xbmc.getCondVisibility')
+    return False
+
+
+def translatePath(path):
+    import xbmcvfs
+    return xbmcvfs.translatePath(path)
+
+
+class PlayList:
+    def __init__(self, playlist_id):
+        self.items = []
+
+    def clear(self):
+        record('PlayList.clear')
+        self.items = []
+
+    def add(self, url, listitem=None, index=-1):
+        record('PlayList.add')
+        self.items.append((url, listitem))
+
+    def size(self):
+        return len(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Player:
+    def __init__(self):
+        pass
+
+    def play(self, item=None, listitem=None, windowed=False, startpos=-1):
+        record('Player.play')
+        mark('paint')
+
+    def isPlaying(self):
+        return False
+
+    def isPlayingAudio(self):
+        return False
+
+    def getTime(self):
+        return 0.0
+
+    def getTotalTime(self):
+        return 0.0
+
+    def getPlayingFile(self):
+        return ''
+
+    def seekTime(self, seconds):
+        record('Player.seekTime')
+
+
+class Monitor:
+    def __init__(self):
+        pass
+
+    def abortRequested(self):
+        return True
+
+    def waitForAbort(self, timeout=0):
+        return True
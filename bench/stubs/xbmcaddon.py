@@ -0,0 +1,37 @@
+"""Stand-in for Kodi's xbmcaddon module backed by an in-memory settings dict"""
+from _recorder import record
+
+# Filled in by the benchmark runner before the plugin is imported
+SETTINGS = {}
+ADDON_INFO = {
+    'id': 'plugin.audio.audiobookshelf',
+    'name': 'Audiobookshelf',
+    'version': '0.0.0',
+    'path': '',
+    'profile': '',
+}
+
+
+class Addon:
+    def __init__(self, id=None):
+        pass
+
+    def getSetting(self, key):
+        record('Addon.getSetting')
+        return SETTINGS.get(key, '')
+
+    def setSetting(self, key, value):
+        record('Addon.setSetting')
+        SETTINGS[key] = value
+
+    def getSettingBool(self, key):
+        return self.getSetting(key) == 'true'
+
+    def getSettingInt(self, key):
+        return int(self.getSetting(key) or 0)
+
+    def getAddonInfo(self, key):
+        return ADDON_INFO.get(key, '')
+
+    def getLocalizedString(self, string_id):
+        return str(string_id)
@@ -0,0 +1,96 @@
+"""Stand-in for Kodi's xbmcgui module that records calls"""
+from _recorder import record
+
+NOTIFICATION_INFO = 'info'
+NOTIFICATION_WARNING = 'warning'
+NOTIFICATION_ERROR = 'error'
+
+INPUT_ALPHANUM = 0
+
+
+class ListItem:
+    __slots__ = ('label', 'path', 'info', 'art', 'properties', 'context_menu', 'mime_type', 'content_lookup')
+
+    def __init__(self, label='', label2='', path='', offscreen=False):
+        record('ListItem')
+        self.label = label
+        self.path = path
+        self.info = None
+        self.art = None
+        self.properties = {}
+        self.context_menu = None
+        self.mime_type = ''
+        self.content_lookup = True
+
+    def getLabel(self):
+        return self.label
+
+    def setLabel(self, label):
+        self.label = label
+
+    def setInfo(self, info_type, info_labels):
+        record('ListItem.setInfo')
+        self.info = info_labels
+
+    def setArt(self, art):
+        record('ListItem.setArt')
+        self.art = art
+
+    def setProperty(self, key, value):
+        record('ListItem.setProperty')
+        self.properties[key] = value
+
+    def getProperty(self, key):
+        return self.properties.get(key, '')
+
+    def setPath(self, path):
+        self.path = path
+
+    def getPath(self):
+        return self.path
+
+    def setMimeType(self, mime_type):
+        self.mime_type = mime_type
+
+    def setContentLookup(self, enable):
+        self.content_lookup = enable
+
+    def addContextMenuItems(self, items, replaceItems=False):
+        record('ListItem.addContextMenuItems')
+        self.context_menu = items
+
+
+class Dialog:
+    # Returned by input(); benchmarks that exercise search set this
+    input_result = ''
+
+    def notification(self, heading, message, icon='', time=5000, sound=True):
+        record('Dialog.notification')
+
+    def ok(self, heading, message):
+        record('Dialog.ok')
+        return True
+
+    def yesno(self, heading, message, *args, **kwargs):
+        record('Dialog.yesno')
+        return True
+
+    def input(self, heading, defaultt='', type=INPUT_ALPHANUM, option=0, autoclose=0):
+        record('Dialog.input')
+        return Dialog.input_result
+
+
+class Window:
+    properties = {}
+
+    def __init__(self, window_id=-1):
+        pass
+
+    def getProperty(self, key):
+        return Window.properties.get(key, '')
+
+    def setProperty(self, key, value):
+        Window.properties[key] = value
+
+    def clearProperty(self, key):
+        Window.properties.pop(key, None)
@@ -0,0 +1,52 @@
+"""Stand-in for Kodi's xbmcplugin module that records calls"""
+from _recorder import directory_items, mark, record, resolved
+
+SORT_METHOD_NONE = 0
+SORT_METHOD_LABEL = 1
+SORT_METHOD_LABEL_IGNORE_THE = 2
+SORT_METHOD_DATE = 3
+SORT_METHOD_SIZE = 4
+SORT_METHOD_FILE = 5
+SORT_METHOD_DURATION = 8
+SORT_METHOD_TITLE = 9
+SORT_METHOD_TITLE_IGNORE_THE = 10
+SORT_METHOD_ARTIST = 11
+SORT_METHOD_ARTIST_IGNORE_THE = 12
+SORT_METHOD_ALBUM = 13
+SORT_METHOD_GENRE = 16
+SORT_METHOD_UNSORTED = 40
+
+
+def addDirectoryItem(handle, url, listitem, isFolder=False, totalItems=0):
+    record('xbmcplugin.addDirectoryItem')
+    directory_items.append((url, listitem, isFolder))
+    return True
+
+
+def addDirectoryItems(handle, items, totalItems=0):
+    record('xbmcplugin.addDirectoryItems')
+    directory_items.extend(items)
+    return True
+
+
+def endOfDirectory(handle, succeeded=True, updateListing=False, cacheToDisc=True):
+    record('xbmcplugin.endOfDirectory')
+    mark('paint')
+
+
+def setResolvedUrl(handle, succeeded, listitem):
+    record('xbmcplugin.setResolvedUrl')
+    mark('paint')
+    resolved.append((succeeded, listitem))
+
+
+def setContent(handle, content):
+    record('xbmcplugin.setContent')
+
+
+def addSortMethod(handle, sortMethod, labelMask='', label2Mask=''):
+    record('xbmcplugin.addSortMethod')
+
+
+def setPluginCategory(handle, category):
+    record('xbmcplugin.setPluginCategory')
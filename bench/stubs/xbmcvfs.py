@@ -0,0 +1,29 @@
+"""Stand-in for Kodi's xbmcvfs module on the local filesystem"""
+import os
+import shutil
+
+
+def translatePath(path):
+    return path
+
+
+def exists(path):
+    return os.path.exists(path)
+
+
+def mkdirs(path):
+    os.makedirs(path, exist_ok=True)
+    return True
+
+
+def delete(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+
+def rmdir(path, force=False):
+    shutil.rmtree(path, ignore_errors=True)
+    return True
@@ -1,34 +1,175 @@
+import time
+START_TIME = time.perf_counter()
+
 import sys
 import urllib.parse as urlparse
 import xbmc
 import xbmcgui
 import xbmcplugin
 import xbmcaddon
-import requests
+import xbmcvfs
 import json
-import re
+import os
+import threading
+from resources.lib.cache import ResponseCache
+from resources.lib.ipc import DOWNLOADS_PROPERTY, NOW_PLAYING_PROPERTY, SERVICE_PROPERTY, IpcClient
+from resources.lib.profiling import Instrumentation, append_trace, profile_call
+
+# Everything else under resources.lib (and requests, which HttpClient needs) is imported
+# where it is first used, so routes answered from the cache or the service never load it
+
+# Upper bound on concurrent /items/{id} requests when a listing still needs details
+MAX_DETAIL_WORKERS = 6
+
+# Sort orders offered for each listing; the first one is the default
+BOOK_SORT_METHODS = (
+    xbmcplugin.SORT_METHOD_UNSORTED,
+    xbmcplugin.SORT_METHOD_TITLE_IGNORE_THE,
+    xbmcplugin.SORT_METHOD_ARTIST_IGNORE_THE,
+    xbmcplugin.SORT_METHOD_DURATION,
+)
+PODCAST_SORT_METHODS = (
+    xbmcplugin.SORT_METHOD_UNSORTED,
+    xbmcplugin.SORT_METHOD_TITLE_IGNORE_THE,
+    xbmcplugin.SORT_METHOD_ARTIST_IGNORE_THE,
+)
+EPISODE_SORT_METHODS = (
+    xbmcplugin.SORT_METHOD_UNSORTED,
+    xbmcplugin.SORT_METHOD_DATE,
+    xbmcplugin.SORT_METHOD_TITLE,
+    xbmcplugin.SORT_METHOD_DURATION,
+)
+
+# Library mirror: items per sync request, minimum gap between delta syncs, and how
+# often to refetch everything to catch deletions the item count can't reveal
+SYNC_PAGE_SIZE = 500
+DELTA_PAGE_SIZE = 50
+MIN_SYNC_INTERVAL = 60
+FULL_SYNC_INTERVAL = 24 * 3600
+
+# How long a podcast's indexed episode list is used before it is fetched again
+EPISODE_INDEX_TTL = 600
+
+# Arrays in /items/{id} that no route reads; streaming parses skip them
+STREAM_SKIP_KEYS = ('libraryFiles',)
+
+# Most results a search shows
+SEARCH_LIMIT = 200
+
+# Cover widths requested from the server: list thumbnails and posters, and fanart
+THUMB_WIDTH = 400
+FANART_WIDTH = 1280
+
+# Formats Kodi can play directly, announced when opening a playback session
+SUPPORTED_MIME_TYPES = ('audio/flac', 'audio/mpeg', 'audio/mp4', 'audio/ogg', 'audio/aac', 'audio/webm')
+
+# (connect, read) timeouts by endpoint prefix; connect stays short so a dead server fails fast
+TIMEOUTS = (
+    ('/login', (3.05, 10)),
+    ('/items/', (3.05, 20)),
+    ('', (3.05, 15)),
+)
+
+# How long cached responses are served without asking the server, by endpoint prefix
+CACHE_TTLS = (
+    ('/libraries/', 300),
+    ('/libraries', 3600),
+    ('/items/', 600),
+)
 
 class AudiobookshelfPlugin:
-    def __init__(self):
+    def __init__(self, handle=None, use_service=True, metrics=None, quiet=False):
         self.addon = xbmcaddon.Addon()
-        self.handle = int(sys.argv[1])
-        self.server_url = self.addon.getSetting('server_url').rstrip('/')
-        self.username = self.addon.getSetting('username')
-        self.password = self.addon.getSetting('password')
-        self.token = self.addon.getSetting('api_token') or None
+        self.handle = int(sys.argv[1]) if handle is None else handle
+        # Background callers only log login problems instead of showing notifications
+        self.quiet = quiet
+        self.metrics = metrics or Instrumentation()
+        self.settings = {}
+        self.lock = threading.Lock()
+        self._token = None
+        self._token_loaded = False
+        self._http = None
+        self.art_cache = {}
+        self.search_index = None
+        self.mirror = None
+        self.episode_index = None
+        self.chapter_index = None
+        self.covers = None
+        self.downloads = None
+        self.profile_dir = xbmcvfs.translatePath(self.addon.getAddonInfo('profile'))
+        
+        # Let the background service make requests over its warm session when it is running
+        self.service = None
+        service_address = xbmcgui.Window(10000).getProperty(SERVICE_PROPERTY)
+        if use_service and service_address and self.setting('service_enabled') != 'false':
+            self.service = IpcClient(service_address)
         
+        self.cache = None
+        if self.setting('cache_enabled') != 'false':
+            max_mb = int(self.setting('cache_size') or 20)
+            try:
+                self.cache = ResponseCache(os.path.join(self.profile_dir, 'cache.db'), max_mb * 1024 * 1024)
+            except Exception as e:
+                xbmc.log(f'Cache unavailable: {str(e)}', xbmc.LOGWARNING)
+    
+    def setting(self, key):
+        """Addon setting, read from Kodi the first time it is asked for"""
+        value = self.settings.get(key)
+        if value is None:
+            value = self.settings[key] = self.addon.getSetting(key)
+        return value
+    
+    @property
+    def server_url(self):
+        return self.setting('server_url').rstrip('/')
+    
+    @property
+    def username(self):
+        return self.setting('username')
+    
+    @property
+    def password(self):
+        return self.setting('password')
+    
+    @property
+    def token(self):
+        if not self._token_loaded:
+            self._token = self.setting('api_token') or None
+            self._token_loaded = True
+        return self._token
+    
+    @token.setter
+    def token(self, value):
+        self._token = value
+        self._token_loaded = True
+    
+    @property
+    def is_configured(self):
+        """True if there is a token or the credentials to get one"""
+        return bool(self.token or (self.server_url and self.username and self.password))
+    
+    @property
+    def http(self):
+        """Shared HTTP client, created on first use since importing requests is slow"""
+        if self._http is None:
+            with self.lock:
+                if self._http is None:
+                    from resources.lib.client import HttpClient
+                    self._http = HttpClient(pool_size=MAX_DETAIL_WORKERS)
+        return self._http
+    
     def login(self):
         # Use API token if available
         if self.token:
             return True
             
         if not all([self.server_url, self.username, self.password]):
-            xbmcgui.Dialog().notification('Error', 'Please configure server settings', xbmcgui.NOTIFICATION_ERROR)
+            self.notify_login_error('Please configure server settings')
             return False
             
         try:
-            resp = requests.post(f'{self.server_url}/login', 
-                json={'username': self.username, 'password': self.password}, timeout=10)
+            resp = self.http.post(f'{self.server_url}/login', self.get_timeout('/login'),
+                json={'username': self.username, 'password': self.password})
             if resp.status_code == 200:
                 data = resp.json()
                 self.token = data.get('user', {}).get('token')
@@ -39,83 +180,386 @@ class AudiobookshelfPlugin:
         except Exception as e:
             xbmc.log(f'Login error: {str(e)}', xbmc.LOGERROR)
         
-        xbmcgui.Dialog().notification('Error', 'Login failed', xbmcgui.NOTIFICATION_ERROR)
+        self.notify_login_error('Login failed')
         return False
     
-    def api_get(self, endpoint):
+    def notify_login_error(self, message):
+        if self.quiet:
+            xbmc.log(f'Audiobookshelf: {message}', xbmc.LOGWARNING)
+        else:
+            xbmcgui.Dialog().notification('Error', message, xbmcgui.NOTIFICATION_ERROR)
+    
+    def get_timeout(self, endpoint):
+        for prefix, timeout in TIMEOUTS:
+            if endpoint.startswith(prefix):
+                return timeout
+    
+    def get_cache_ttl(self, endpoint):
+        for prefix, ttl in CACHE_TTLS:
+            if endpoint.startswith(prefix):
+                return ttl
+        return 0
+    
+    def api_get(self, endpoint, use_cache=True):
+        body = self.api_get_body(endpoint, use_cache)
+        if body is None:
+            return None
+        with self.metrics.span('json'):
+            return json.loads(body)
+    
+    def api_get_body(self, endpoint, use_cache=True):
+        """Raw JSON body for endpoint, from the cache, the service or the server"""
+        started = time.perf_counter()
+        body, source = self.fetch_body(endpoint, use_cache)
+        elapsed = time.perf_counter() - started
+        size = len(body) if body is not None else 0
+        if source != 'cache':
+            self.metrics.add('network', elapsed)
+            self.metrics.count('bytes', size)
+        self.metrics.count(source)
+        self.metrics.event('get', endpoint=endpoint, source=source, ms=round(elapsed * 1000, 1), bytes=size)
+        return body
+    
+    def fetch_body(self, endpoint, use_cache=True):
+        """(body, source) for endpoint, where source says which of cache, service,
+        server or revalidated (a 304) answered; body is None and source failed on error"""
+        ttl = self.get_cache_ttl(endpoint) if self.cache and use_cache else 0
+        cache_key = f'{self.server_url}/api{endpoint}'
+        cached = self.cache.get(cache_key) if ttl else None
+        if cached and cached.is_fresh(ttl):
+            return cached.body, 'cache'
+        
+        if not self.token and not self.login():
+            return None, 'failed'
+        
+        if self.service:
+            try:
+                body = self.service.get(endpoint, use_cache)
+            except OSError:
+                # The service is gone; fall through to asking the server directly
+                pass
+            else:
+                # The service already tried the server, so a failure there is final
+                return (body, 'service') if body is not None else (None, 'failed')
+        
+        try:
+            for attempt in range(2):
+                headers = {'Authorization': f'Bearer {self.token}'}
+                if cached:
+                    # Let the server answer 304 if nothing changed since we stored it
+                    if cached.etag:
+                        headers['If-None-Match'] = cached.etag
+                    if cached.last_modified:
+                        headers['If-Modified-Since'] = cached.last_modified
+                
+                resp = self.http.get(f'{self.server_url}/api{endpoint}', self.get_timeout(endpoint), headers=headers)
+                if resp.status_code == 401 and attempt == 0 and self.username and self.password:
+                    # Token was revoked or expired; log in again once
+                    self.token = None
+                    if self.login():
+                        continue
+                break
+            
+            if resp.status_code == 304 and cached:
+                self.cache.refresh(cache_key)
+                return cached.body, 'revalidated'
+            if resp.status_code != 200:
+                return None, 'failed'
+            
+            if ttl:
+                self.cache.put(cache_key, resp.content,
+                               resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+            return resp.content, 'server'
+        except Exception as e:
+            xbmc.log(f'API error: {str(e)}', xbmc.LOGERROR)
+            return None, 'failed'
+    
+    def api_stream(self, endpoint, key, skip_keys=()):
+        """Request endpoint and return (stream of the array under key, response), or None"""
+        from resources.lib.stream import CHUNK_SIZE, JsonArrayStream
         if not self.token and not self.login():
             return None
         try:
             headers = {'Authorization': f'Bearer {self.token}'}
-            resp = requests.get(f'{self.server_url}/api{endpoint}', headers=headers, timeout=15)
-            return resp.json() if resp.status_code == 200 else None
+            with self.metrics.span('network'):
+                resp = self.http.get(f'{self.server_url}/api{endpoint}', self.get_timeout(endpoint),
+                                     headers=headers, stream=True)
+            self.metrics.count('server')
+            self.metrics.event('stream', endpoint=endpoint, status=resp.status_code)
+            if resp.status_code != 200:
+                resp.close()
+                return None
         except Exception as e:
             xbmc.log(f'API error: {str(e)}', xbmc.LOGERROR)
             return None
+        return JsonArrayStream(resp.iter_content(CHUNK_SIZE), key, skip_keys), resp
     
-    def get_cover_url(self, item_id):
-        """Get cover URL with authentication token"""
+    def api_post(self, endpoint, payload=None):
+        return self.api_send('POST', endpoint, payload)
+    
+    def api_send(self, method, endpoint, payload=None):
+        """Send JSON to endpoint and return the decoded reply ({} if empty), or None"""
+        if not self.token and not self.login():
+            return None
+        started = time.perf_counter()
+        try:
+            send = self.http.patch if method == 'PATCH' else self.http.post
+            resp = send(f'{self.server_url}/api{endpoint}', self.get_timeout(endpoint),
+                        headers={'Authorization': f'Bearer {self.token}'}, json=payload)
+            if resp.status_code != 200:
+                xbmc.log(f'API error: {method} {endpoint} returned {resp.status_code}', xbmc.LOGWARNING)
+                return None
+            return resp.json() if resp.content else {}
+        except Exception as e:
+            xbmc.log(f'API error: {str(e)}', xbmc.LOGERROR)
+            return None
+        finally:
+            self.metrics.add('network', time.perf_counter() - started)
+            self.metrics.count('server')
+    
+    def get_device_id(self):
+        """Identifier the server groups this Kodi's playback sessions under, made once per install"""
+        device_id = self.setting('device_id')
+        if not device_id:
+            import uuid
+            device_id = self.settings['device_id'] = uuid.uuid4().hex
+            self.addon.setSetting('device_id', device_id)
+        return device_id
+    
+    def clear_cache(self):
+        if self.cache:
+            self.cache.clear()
+        if self.get_mirror():
+            self.mirror.clear()
+        # Rebuilt with the mirror, so items deleted on the server meanwhile don't stay searchable
+        if self.get_search_index():
+            self.search_index.clear()
+        if self.get_episode_index():
+            self.episode_index.clear()
+        if self.get_chapter_index():
+            self.chapter_index.clear()
+        if self.get_covers():
+            self.covers.clear()
+        xbmcgui.Dialog().notification('Audiobookshelf', 'Cache cleared', xbmcgui.NOTIFICATION_INFO)
+    
+    def get_search_index(self):
+        if self.search_index is None and self.setting('search_enabled') != 'false':
+            from resources.lib.search import SearchIndex
+            try:
+                self.search_index = SearchIndex(os.path.join(self.profile_dir, 'search.db'))
+            except Exception as e:
+                xbmc.log(f'Search index unavailable: {str(e)}', xbmc.LOGWARNING)
+        return self.search_index
+    
+    def get_mirror(self):
+        if self.mirror is None and self.setting('mirror_enabled') != 'false':
+            from resources.lib.mirror import LibraryMirror
+            try:
+                self.mirror = LibraryMirror(os.path.join(self.profile_dir, 'mirror.db'))
+            except Exception as e:
+                xbmc.log(f'Library mirror unavailable: {str(e)}', xbmc.LOGWARNING)
+        return self.mirror
+    
+    def get_episode_index(self):
+        if self.episode_index is None:
+            from resources.lib.episodes import EpisodeIndex
+            try:
+                self.episode_index = EpisodeIndex(os.path.join(self.profile_dir, 'episodes.db'))
+            except Exception as e:
+                xbmc.log(f'Episode index unavailable: {str(e)}', xbmc.LOGWARNING)
+        return self.episode_index
+    
+    def get_chapter_index(self):
+        if self.chapter_index is None:
+            from resources.lib.chapters import ChapterIndex
+            try:
+                self.chapter_index = ChapterIndex(os.path.join(self.profile_dir, 'chapters.db'))
+            except Exception as e:
+                xbmc.log(f'Chapter index unavailable: {str(e)}', xbmc.LOGWARNING)
+        return self.chapter_index
+    
+    def index_chapters(self, item_id, item_data):
+        chapter_index = self.get_chapter_index()
+        if not chapter_index:
+            return
+        try:
+            chapter_index.update(item_id, item_data)
+        except Exception as e:
+            xbmc.log(f'Chapter index update failed: {str(e)}', xbmc.LOGWARNING)
+    
+    def update_search_index(self, lib_id, media_type, items, removed=()):
+        search_index = self.get_search_index()
+        if not search_index:
+            return
+        try:
+            search_index.update(lib_id, media_type, items)
+            if removed:
+                search_index.remove(removed)
+        except Exception as e:
+            xbmc.log(f'Search index update failed: {str(e)}', xbmc.LOGWARNING)
+    
+    def get_cover_url(self, item_id, width=None):
+        """Get cover URL with authentication token, resized by the server when width is given"""
         cover_url = f'{self.server_url}/api/items/{item_id}/cover'
+        query = {'width': width, 'format': 'jpeg'} if width else {}
         if self.token:
-            cover_url += f'?token={self.token}'
+            query['token'] = self.token
+        if query:
+            cover_url += '?' + urlparse.urlencode(query)
         return cover_url
     
+    def get_downloads(self, create=True):
+        """Download store, or None if it is unavailable (or, unless create, nothing was ever downloaded)"""
+        if self.downloads is None:
+            directory = os.path.join(self.profile_dir, 'downloads')
+            if not create and not os.path.exists(os.path.join(directory, 'downloads.db')):
+                return None
+            from resources.lib.downloads import DownloadStore
+            try:
+                self.downloads = DownloadStore(directory)
+            except Exception as e:
+                xbmc.log(f'Downloads unavailable: {str(e)}', xbmc.LOGWARNING)
+        return self.downloads
+    
+    def fetch_range(self, url, start, end):
+        """(total size, chunks) for bytes start-end of a server file path; used by the download manager"""
+        from resources.lib.downloads import CHUNK_SIZE, DownloadError
+        if not self.token and not self.login():
+            raise DownloadError('Not logged in')
+        resp = self.http.get(f'{self.server_url}{url}', self.get_timeout('/items/'), stream=True,
+                             headers={'Authorization': f'Bearer {self.token}', 'Range': f'bytes={start}-{end}'})
+        content_range = resp.headers.get('Content-Range', '')
+        if resp.status_code != 206 or not content_range.startswith(f'bytes {start}-'):
+            resp.close()
+            raise DownloadError(f'{url}: range request answered with {resp.status_code}')
+        
+        def chunks():
+            with resp:
+                yield from resp.iter_content(CHUNK_SIZE)
+        return int(content_range.rpartition('/')[2]), chunks()
+    
+    def download(self, item_id, episode_id=None):
+        """Queue a book's audio files, or one episode's, for the service to download"""
+        downloads = self.get_downloads()
+        item_data = self.api_get(f'/items/{item_id}')
+        if not downloads or not item_data:
+            xbmcgui.Dialog().notification('Error', 'Could not queue download', xbmcgui.NOTIFICATION_ERROR)
+            return
+        media = item_data.get('media', {})
+        title = media.get('metadata', {}).get('title', 'Unknown')
+        if episode_id:
+            episode = next((ep for ep in self.get_episodes(item_data) or [] if ep.get('id') == episode_id), None)
+            audio_files = [episode['audioFile']] if episode and episode.get('audioFile') else []
+            title = f'{title}: {episode.get("title", "Episode")}' if episode else title
+        else:
+            audio_files = media.get('audioFiles', [])
+        if not audio_files:
+            xbmcgui.Dialog().notification('Error', 'No audio files found', xbmcgui.NOTIFICATION_ERROR)
+            return
+        
+        files = []
+        for audio_file in audio_files:
+            file_metadata = audio_file.get('metadata', {})
+            ext = file_metadata.get('ext') or os.path.splitext(file_metadata.get('filename', ''))[1]
+            files.append((audio_file['ino'], f'/api/items/{item_id}/file/{audio_file["ino"]}',
+                          file_metadata.get('size') or 0, ext, audio_file.get('duration')))
+        downloads.add(item_id, episode_id, title, files)
+        xbmcgui.Window(10000).setProperty(DOWNLOADS_PROPERTY, str(time.time()))
+        if self.service:
+            xbmcgui.Dialog().notification('Audiobookshelf', f'Downloading {title}', xbmcgui.NOTIFICATION_INFO)
+        else:
+            xbmcgui.Dialog().notification('Audiobookshelf', 'Queued; downloads run in the background service',
+                                          xbmcgui.NOTIFICATION_WARNING)
+    
+    def delete_download(self, item_id, episode_id=None):
+        downloads = self.get_downloads(create=False)
+        if downloads:
+            downloads.remove(item_id, episode_id)
+        xbmc.executebuiltin('Container.Refresh')
+    
+    def list_downloads(self):
+        downloads = self.get_downloads(create=False)
+        items = []
+        for item_id, episode_id, title, files, files_done, size, size_done in downloads.get_items() if downloads else []:
+            label = title if files_done == files else f'{title} ({size_done * 100 // max(size, 1)}%)'
+            li = xbmcgui.ListItem(label, offscreen=True)
+            li.setInfo('music', {'title': title, 'mediatype': 'song'})
+            li.setArt(self.get_art(item_id, poster=False))
+            if files_done == files:
+                li.setProperty('IsPlayable', 'true')
+            query = f'id={item_id}&episode={episode_id}&type=podcast' if episode_id else f'id={item_id}&type=book'
+            li.addContextMenuItems([('Delete download', f'RunPlugin({sys.argv[0]}?action=delete_download&{query})')])
+            items.append((f'{sys.argv[0]}?action=play&{query}', li, False))
+        self.add_directory(items, 'songs')
+    
+    def get_covers(self):
+        if self.covers is None and self.setting('cover_cache') != 'false':
+            from resources.lib.covers import CoverCache
+            max_mb = int(self.setting('cover_cache_size') or 200)
+            try:
+                self.covers = CoverCache(os.path.join(self.profile_dir, 'covers'), self.fetch_cover,
+                                         max_mb * 1024 * 1024)
+            except Exception as e:
+                xbmc.log(f'Cover cache unavailable: {str(e)}', xbmc.LOGWARNING)
+        return self.covers
+    
+    def fetch_cover(self, item_id, width):
+        """Resized cover image bytes, or None"""
+        if not self.token and not self.login():
+            return None
+        try:
+            resp = self.http.get(f'{self.server_url}/api/items/{item_id}/cover?width={width}&format=jpeg',
+                                 self.get_timeout('/items/'), headers={'Authorization': f'Bearer {self.token}'})
+        except Exception as e:
+            xbmc.log(f'Cover error: {str(e)}', xbmc.LOGWARNING)
+            return None
+        self.metrics.count('bytes', len(resp.content))
+        if resp.status_code != 200 or not resp.headers.get('Content-Type', '').startswith('image/'):
+            return None
+        return resp.content
+    
+    def get_cover(self, item_id, width, fallback_width=None):
+        """Local copy of a cover when there is one (a stable texture cache key), else its URL.
+        
+        With fallback_width, a local copy at that width is used before the URL.
+        """
+        covers = self.get_covers()
+        if covers:
+            path = covers.get(item_id, width) or fallback_width and covers.get(item_id, fallback_width)
+            if path:
+                return path
+        return self.get_cover_url(item_id, width)
+    
+    def warm_covers(self, item_ids, fanart=False):
+        """Download the list covers (and optionally fanart) of item_ids the cache doesn't have yet"""
+        covers = self.get_covers()
+        if not covers or not item_ids:
+            return
+        try:
+            covers.warm(item_ids, THUMB_WIDTH)
+            if fanart:
+                covers.warm(item_ids, FANART_WIDTH)
+        except Exception as e:
+            xbmc.log(f'Cover cache update failed: {str(e)}', xbmc.LOGWARNING)
+    
+    def get_art(self, item_id, poster=True):
+        """Artwork dict for an item's cover, built once per item and reused"""
+        key = (item_id, poster)
+        art = self.art_cache.get(key)
+        if art is None:
+            thumb = self.get_cover(item_id, THUMB_WIDTH)
+            # Listings only warm the list size, so until the fanart is downloaded the local list
+            # cover stands in for it rather than a URL carrying the token
+            art = {'thumb': thumb, 'icon': thumb, 'fanart': self.get_cover(item_id, FANART_WIDTH, THUMB_WIDTH)}
+            if poster:
+                art['poster'] = thumb
+            self.art_cache[key] = art
+        return art
+    
     def clean_html(self, text):
         """Remove HTML tags and decode HTML entities"""
-        if not text:
-            return ''
-        
-        # Remove image tags and their content completely
-        text = re.sub(r'<img[^>]*>', '', text, flags=re.IGNORECASE)
-        
-        # Remove other problematic tags that might contain unwanted content
-        text = re.sub(r'<script[^>]*>.*?</script>', '', text, flags=re.IGNORECASE | re.DOTALL)
-        text = re.sub(r'<style[^>]*>.*?</style>', '', text, flags=re.IGNORECASE | re.DOTALL)
-        
-        # Convert common HTML formatting to plain text equivalents
-        text = re.sub(r'<br\s*/?>', '\n', text, flags=re.IGNORECASE)
-        text = re.sub(r'<p[^>]*>', '\n', text, flags=re.IGNORECASE)
-        text = re.sub(r'</p>', '\n', text, flags=re.IGNORECASE)
-        text = re.sub(r'<div[^>]*>', '\n', text, flags=re.IGNORECASE)
-        text = re.sub(r'</div>', '\n', text, flags=re.IGNORECASE)
-        
-        # Remove all remaining HTML tags
-        text = re.sub(r'<[^>]+>', '', text)
-        
-        # Decode HTML entities (more comprehensive list)
-        html_entities = {
-            '&amp;': '&',
-            '&lt;': '<',
-            '&gt;': '>',
-            '&quot;': '"',
-            '&apos;': "'",
-            '&nbsp;': ' ',
-            '&#39;': "'",
-            '&mdash;': '—',
-            '&ndash;': '–',
-            '&hellip;': '...',
-            '&ldquo;': '"',
-            '&rdquo;': '"',
-            '&lsquo;': "'",
-            '&rsquo;': "'",
-            '&bull;': '•',
-            '&copy;': '©',
-            '&reg;': '®',
-            '&trade;': '™'
-        }
-        
-        for entity, char in html_entities.items():
-            text = text.replace(entity, char)
-        
-        # Handle numeric HTML entities (like &#8217;)
-        text = re.sub(r'&#(\d+);', lambda m: chr(int(m.group(1))) if int(m.group(1)) < 65536 else '', text)
-        
-        # Clean up extra whitespace and newlines
-        text = re.sub(r'\n\s*\n', '\n\n', text)  # Multiple newlines to double newline
-        text = re.sub(r'[ \t]+', ' ', text)  # Multiple spaces/tabs to single space
-        text = text.strip()
-        
-        return text
+        from resources.lib.text import clean_html
+        return clean_html(text)
     
     def format_duration(self, seconds):
         """Format duration in seconds to human readable format"""
@@ -131,56 +575,178 @@ class AudiobookshelfPlugin:
             return f'{minutes}m'
     
     def get_episode_count(self, item_data):
-        """Get accurate episode count from item data"""
+        """Get accurate episode count from item data, or None if it is not included"""
+        media = item_data.get('media', {})
+        
+        # Library listings carry a precomputed count
+        for source in (media, item_data):
+            count = source.get('numEpisodes')
+            if isinstance(count, int):
+                return count
+        
+        episodes = self.get_episodes(item_data)
+        if episodes is None:
+            return None
+        
+        return len(episodes)
+    
+    def get_episodes(self, item_data):
+        """Episode list from item data, or None if it has none of the known episode fields"""
         media = item_data.get('media', {})
         
         # Try different episode locations
-        episodes = []
         if 'episodes' in media:
-            episodes = media['episodes']
+            return media['episodes'] or []
         elif 'episodes' in item_data:
-            episodes = item_data['episodes']
+            return item_data['episodes'] or []
         elif 'podcastEpisodes' in item_data:
-            episodes = item_data['podcastEpisodes']
+            return item_data['podcastEpisodes'] or []
+        return None
+    
+    def use_streaming(self):
+        return self.setting('stream_episodes') != 'false'
+    
+    def stream_episodes(self, item_id, select):
+        """Stream a podcast's episodes through select (records in, result out).
+        
+        Returns (result, podcast data without its episode list) or (None, None).
+        """
+        from resources.lib.stream import EpisodeRecord
+        result = self.api_stream(f'/items/{item_id}', 'episodes', STREAM_SKIP_KEYS)
+        if not result:
+            return None, None
+        stream, resp = result
+        try:
+            with resp:
+                episodes = iter(stream)
+                selected = select(EpisodeRecord.from_json(ep) for ep in episodes)
+                # Read the rest even if select stopped early; the podcast data comes after
+                for _ in episodes:
+                    pass
+                self.metrics.count('bytes', resp.raw.tell())
+        except Exception as e:
+            xbmc.log(f'API error: {str(e)}', xbmc.LOGERROR)
+            return None, None
         
-        return len(episodes) if episodes else 0
+        data = stream.document
+        if not selected and data.get('podcastEpisodes'):
+            # Episodes under a key we don't stream
+            selected = select(EpisodeRecord.from_json(ep) for ep in data.pop('podcastEpisodes'))
+        return selected, data
+    
+    def fetch_items(self, item_ids):
+        """Fetch /items/{id} for several items concurrently, keyed by item id"""
+        if not item_ids:
+            return {}
+        if not self.token and not self.login():
+            return {}
+        
+        from concurrent.futures import ThreadPoolExecutor
+        workers = min(MAX_DETAIL_WORKERS, len(item_ids))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(lambda item_id: self.api_get(f'/items/{item_id}'), item_ids)
+            return dict(zip(item_ids, results))
     
     def list_libraries(self):
-        data = self.api_get('/libraries')
-        if not data:
-            return
-            
+        # Offline there are no libraries, but search, widgets and downloads still work
+        data = self.api_get('/libraries') or {}
+        
+        items = []
         for lib in data.get('libraries', []):
             if lib.get('mediaType') in ['book', 'podcast']:
                 media_type = lib.get('mediaType')
                 name = f"{lib['name']} ({media_type.title()})"
-                li = xbmcgui.ListItem(name)
+                li = xbmcgui.ListItem(name, offscreen=True)
                 li.setInfo('music', {'title': name})
                 url = f'{sys.argv[0]}?action=library&id={lib["id"]}&type={media_type}'
-                xbmcplugin.addDirectoryItem(self.handle, url, li, True)
+                items.append((url, li, True))
+        
+        from resources.lib.widgets import WIDGETS
+        for kind, label, _ in WIDGETS:
+            li = xbmcgui.ListItem(label, offscreen=True)
+            li.setArt({'icon': 'DefaultFolder.png'})
+            items.append((f'{sys.argv[0]}?action=widget&kind={kind}', li, True))
         
-        xbmcplugin.endOfDirectory(self.handle)
+        if self.setting('search_enabled') != 'false':
+            li = xbmcgui.ListItem('Search', offscreen=True)
+            li.setArt({'icon': 'DefaultAddonsSearch.png'})
+            items.append((f'{sys.argv[0]}?action=search', li, True))
+        
+        if self.get_downloads(create=False):
+            li = xbmcgui.ListItem('Downloads', offscreen=True)
+            li.setArt({'icon': 'DefaultFolder.png'})
+            items.append((f'{sys.argv[0]}?action=downloads', li, True))
+        
+        self.add_directory(items)
+    
+    def refresh_widgets(self):
+        """Rebuild the widget snapshot from each library's personalized shelves; returns it, or None"""
+        from resources.lib.widgets import WIDGET_SIZE, build_snapshot, save_snapshot
+        data = self.api_get('/libraries')
+        if not data:
+            return None
+        shelves = []
+        for lib in data.get('libraries', []):
+            if lib.get('mediaType') not in ('book', 'podcast'):
+                continue
+            lib_shelves = self.api_get(f'/libraries/{lib["id"]}/personalized?limit={WIDGET_SIZE}', use_cache=False)
+            if lib_shelves is None:
+                # Keep the previous snapshot rather than save one with a library missing
+                return None
+            shelves.extend(lib_shelves)
+        snapshot = build_snapshot(shelves)
+        save_snapshot(os.path.join(self.profile_dir, 'widgets.json'), snapshot)
+        return snapshot
+    
+    def list_widget(self, kind):
+        """A home screen widget, served from the snapshot the service refreshes"""
+        from resources.lib.widgets import SNAPSHOT_MAX_AGE, load_snapshot
+        snapshot = load_snapshot(os.path.join(self.profile_dir, 'widgets.json'))
+        service_refreshes = self.service is not None and self.setting('service_widgets') != 'false'
+        if not snapshot or (not service_refreshes and time.time() - snapshot['updated_at'] > SNAPSHOT_MAX_AGE):
+            # Nothing else keeps it fresh unless the service does
+            snapshot = self.refresh_widgets() or snapshot
+        entries = snapshot['widgets'].get(kind, []) if snapshot else []
+        
+        items = []
+        with self.metrics.span('build'):
+            for entry in entries:
+                if entry.get('recentEpisode'):
+                    from resources.lib.stream import EpisodeRecord
+                    podcast_title = entry['media']['metadata'].get('title', 'Unknown Podcast')
+                    items.append(self.build_episode_item(EpisodeRecord.from_json(entry['recentEpisode']), entry['id'],
+                                                         podcast_title, self.get_art(entry['id'], poster=False)))
+                elif entry.get('mediaType') == 'podcast':
+                    items.append(self.build_podcast_item(entry, entry['media'].get('numEpisodes', 0)))
+                else:
+                    items.append(self.build_book_item(entry))
+        self.add_directory(items, 'songs')
     
     def play_item(self, item_id, media_type='book', episode_id=None):
+        # A complete download plays without waiting on a server that may be slow or unreachable
+        if self.play_downloaded(item_id, episode_id):
+            return
+        
         if media_type == 'podcast' and episode_id:
-            # Get episode details first
-            item_data = self.api_get(f'/items/{item_id}')
+            # Get episode details first, from the episode index when we have it
+            podcast = self.get_podcast_index(item_id)
+            record = self.episode_index.get_episode(item_id, episode_id) if podcast else None
+            if record:
+                episode = record.to_json()
+                item_data = {'media': {'metadata': {'title': podcast['title']}}}
+            elif self.use_streaming():
+                find = lambda records: next((ep.to_json() for ep in records if ep.id == episode_id), None)
+                episode, item_data = self.stream_episodes(item_id, find)
+            else:
+                item_data = self.api_get(f'/items/{item_id}')
+                episodes = self.get_episodes(item_data) or [] if item_data else []
+                episode = next((ep for ep in episodes if ep.get('id') == episode_id), None)
+            
             if not item_data:
                 xbmcgui.Dialog().notification('Error', 'Could not load podcast data', xbmcgui.NOTIFICATION_ERROR)
                 return
-            
-            # Find the episode
-            episodes = []
             media = item_data.get('media', {})
             
-            if 'episodes' in media:
-                episodes = media['episodes']
-            elif 'episodes' in item_data:
-                episodes = item_data['episodes']
-            elif 'podcastEpisodes' in item_data:
-                episodes = item_data['podcastEpisodes']
-            
-            episode = next((ep for ep in episodes if ep.get('id') == episode_id), None)
             if not episode:
                 xbmcgui.Dialog().notification('Error', 'Episode not found', xbmcgui.NOTIFICATION_ERROR)
                 return
@@ -197,9 +763,7 @@ class AudiobookshelfPlugin:
                 xbmcgui.Dialog().notification('Error', 'Invalid audio file', xbmcgui.NOTIFICATION_ERROR)
                 return
             
-            stream_url = f'{self.server_url}/api/items/{item_id}/file/{file_ino}'
-            if self.token:
-                stream_url += f'?token={self.token}'
+            stream_url = self.get_file_url(item_id, file_ino, episode_id)
             
             # Get podcast metadata for episode
             podcast_metadata = media.get('metadata', {})
@@ -220,22 +784,20 @@ class AudiobookshelfPlugin:
             })
             
             # Set artwork - use podcast cover
-            cover_url = self.get_cover_url(item_id)
-            li.setArt({
-                'thumb': cover_url,
-                'icon': cover_url,
-                'fanart': cover_url
-            })
+            li.setArt(self.get_art(item_id, poster=False))
             
             # Set the resolved URL
             li.setPath(stream_url)
-            xbmcplugin.setResolvedUrl(self.handle, True, li)
+            self.set_now_playing(item_id, episode_id, episode.get('duration', audio_file.get('duration', 0)),
+                                 [(stream_url, 0)])
+            self.resolve(li)
             return
         
         # Handle audiobook playback
         item_data = self.api_get(f'/items/{item_id}')
         if not item_data:
             return
+        self.index_chapters(item_id, item_data)
             
         media = item_data.get('media', {})
         audio_files = media.get('audioFiles', [])
@@ -244,53 +806,137 @@ class AudiobookshelfPlugin:
             xbmcgui.Dialog().notification('Error', 'No audio files found', xbmcgui.NOTIFICATION_ERROR)
             return
         
+        metadata = media.get('metadata', {})
+        
         # For single file audiobooks, resolve directly
         if len(audio_files) == 1:
-            file_url = f'{self.server_url}/api/items/{item_id}/file/{audio_files[0]["ino"]}'
-            if self.token:
-                file_url += f'?token={self.token}'
-            
-            metadata = media.get('metadata', {})
-            title = metadata.get('title', 'Unknown')
-            author = metadata.get('authorName', 'Unknown Author')
-            description = self.clean_html(metadata.get('description', ''))
-            
-            li = xbmcgui.ListItem(title)
-            li.setInfo('music', {
-                'title': title,
-                'artist': author,
-                'plot': description,  # Use plot instead of comment
-                'duration': int(audio_files[0].get('duration', 0)),
-                'mediatype': 'song'
-            })
-            
-            # Set artwork
-            cover_url = self.get_cover_url(item_id)
-            li.setArt({
-                'thumb': cover_url,
-                'icon': cover_url,
-                'fanart': cover_url
-            })
-            
-            li.setPath(file_url)
-            xbmcplugin.setResolvedUrl(self.handle, True, li)
+            file_url = self.get_file_url(item_id, audio_files[0]['ino'])
+            duration = audio_files[0].get('duration', 0)
+            self.set_now_playing(item_id, None, duration, [(file_url, 0)])
+            self.resolve(self.build_book_play_item(item_id, metadata, duration, file_url))
+            return
+        
+        # Multi-part books play as one continuous stream from a server playback session,
+        # unless every part has been downloaded
+        urls = [self.get_file_url(item_id, audio_file['ino']) for audio_file in audio_files]
+        is_local = not any(url.startswith(self.server_url) for url in urls)
+        if not is_local and self.use_sessions() and self.play_session(item_id, metadata):
             return
         
-        # For multi-part audiobooks, create playlist
+        # Without a session, queue a playlist with one entry per file
+        self.play_parts(item_id, metadata, audio_files, urls)
+    
+    def get_file_url(self, item_id, ino, episode_id=None):
+        """Downloaded copy of an audio file if there is one, else its URL on the server"""
+        downloads = self.get_downloads(create=False)
+        local_path = downloads.get_local_path(item_id, ino, episode_id) if downloads else None
+        if local_path:
+            return local_path
+        file_url = f'{self.server_url}/api/items/{item_id}/file/{ino}'
+        if self.token:
+            file_url += f'?token={self.token}'
+        return file_url
+    
+    def play_downloaded(self, item_id, episode_id=None):
+        """Play an item from its downloads if all of its files are there; False if they aren't"""
+        downloads = self.get_downloads(create=False)
+        files = downloads.get_files(item_id, episode_id) if downloads else []
+        if not files:
+            return False
+        metadata = {'title': files[0][1], 'authorName': ''}
+        if not episode_id:
+            # Author and description, if the book was indexed when it was last played
+            chapter_index = self.get_chapter_index()
+            book = chapter_index.get_book(item_id) if chapter_index else None
+            if book:
+                metadata = book['metadata']
+        if len(files) == 1:
+            path, _, duration = files[0]
+            self.set_now_playing(item_id, episode_id, duration, [(path, 0)])
+            self.resolve(self.build_book_play_item(item_id, metadata, duration, path))
+        else:
+            self.play_parts(item_id, metadata, [{'duration': duration or 0} for _, _, duration in files],
+                            [path for path, _, _ in files])
+        return True
+    
+    def build_book_play_item(self, item_id, metadata, duration, url):
+        """ListItem to resolve a whole book (one file or one session stream) to"""
+        title = metadata.get('title', 'Unknown')
+        author = metadata.get('authorName', 'Unknown Author')
+        description = self.clean_html(metadata.get('description', ''))
+        
+        li = xbmcgui.ListItem(title)
+        li.setInfo('music', {
+            'title': title,
+            'artist': author,
+            'plot': description,  # Use plot instead of comment
+            'duration': int(duration or 0),
+            'mediatype': 'song'
+        })
+        
+        # Set artwork
+        li.setArt(self.get_art(item_id, poster=False))
+        
+        li.setPath(url)
+        return li
+    
+    def use_sessions(self):
+        """True if multi-part books should play through a server playback session.
+        
+        An open session keeps a transcode running on the server, and only the service's
+        progress monitor closes them, so without it books play as a playlist instead.
+        """
+        return (self.setting('play_sessions') != 'false' and self.service is not None
+                and self.setting('sync_progress') != 'false')
+    
+    def play_session(self, item_id, metadata):
+        """Resolve a book to the single stream of a new playback session; False if there is none"""
+        session = self.api_post(f'/items/{item_id}/play', {
+            'deviceInfo': {'clientName': 'Kodi', 'deviceId': self.get_device_id()},
+            'mediaPlayer': 'kodi',
+            'supportedMimeTypes': list(SUPPORTED_MIME_TYPES),
+            # Ask for a single HLS stream rather than the book's individual files
+            'forceTranscode': True,
+        })
+        if not session:
+            return False
+        tracks = session.get('audioTracks') or []
+        if len(tracks) != 1 or not tracks[0].get('contentUrl'):
+            # The server chose to direct play the parts; a playlist does that without a session
+            self.api_post(f'/session/{session["id"]}/close')
+            return False
+        
+        track = tracks[0]
+        stream_url = f'{self.server_url}{track["contentUrl"]}'
+        if self.token:
+            stream_url += f'{"&" if "?" in stream_url else "?"}token={self.token}'
+        
+        duration = session.get('duration') or track.get('duration')
+        li = self.build_book_play_item(item_id, metadata, duration, stream_url)
+        if track.get('mimeType'):
+            li.setMimeType(track['mimeType'])
+        li.setContentLookup(False)
+        li.setProperty('audiobookshelf.session_id', session['id'])
+        self.set_now_playing(item_id, None, duration, [(stream_url, 0)], session['id'])
+        self.resolve(li)
+        return True
+    
+    def play_parts(self, item_id, metadata, audio_files, urls, start_track=0, start_offset=0):
+        """Play a multi-part book as a playlist with one entry per file, at urls.
+        
+        Playback begins start_offset seconds into the file at index start_track.
+        """
         playlist = xbmc.PlayList(xbmc.PLAYLIST_MUSIC)
         playlist.clear()
         
-        metadata = media.get('metadata', {})
         title = metadata.get('title', 'Unknown')
         author = metadata.get('authorName', 'Unknown Author')
         description = self.clean_html(metadata.get('description', ''))
-        cover_url = self.get_cover_url(item_id)
+        art = self.get_art(item_id, poster=False)
+        tracks = []
+        offset = 0
         
-        for i, audio_file in enumerate(audio_files):
-            file_url = f'{self.server_url}/api/items/{item_id}/file/{audio_file["ino"]}'
-            if self.token:
-                file_url += f'?token={self.token}'
-            
+        for i, (audio_file, file_url) in enumerate(zip(audio_files, urls)):
             li = xbmcgui.ListItem(f'{title} - Part {i+1}')
             li.setInfo('music', {
                 'title': f'{title} - Part {i+1}',
@@ -302,206 +948,540 @@ class AudiobookshelfPlugin:
             })
             
             # Set artwork for each part
-            li.setArt({
-                'thumb': cover_url,
-                'icon': cover_url,
-                'fanart': cover_url
-            })
+            li.setArt(art)
+            
+            if i == start_track and start_offset:
+                li.setProperty('StartOffset', str(start_offset))
             
             li.setPath(file_url)
             playlist.add(file_url, li)
+            tracks.append((file_url, offset))
+            offset += audio_file.get('duration', 0)
         
-        xbmc.Player().play(playlist)
+        self.set_now_playing(item_id, None, offset, tracks)
+        with self.metrics.span('render'):
+            xbmc.Player().play(playlist, startpos=start_track)
     
-    def list_library_items(self, lib_id, media_type='book'):
-        data = self.api_get(f'/libraries/{lib_id}/items?limit=100&include=rssfeed')
-        if not data:
+    def get_book_chapters(self, item_id):
+        """(metadata, parts, chapters) of a book, from the chapter index unless it is missing or stale.
+        
+        parts lists (ino, duration) per audio file and chapters (number, title, start,
+        end, track, offset) per chapter, as ChapterIndex.get_chapters returns them.
+        """
+        chapter_index = self.get_chapter_index()
+        book = chapter_index.get_book(item_id) if chapter_index else None
+        if book and not chapter_index.is_stale(book):
+            return book['metadata'], book['parts'], chapter_index.get_chapters(item_id)
+        
+        item_data = self.api_get(f'/items/{item_id}')
+        if not item_data:
+            # Offline, an outdated index still beats nothing
+            if book:
+                return book['metadata'], book['parts'], chapter_index.get_chapters(item_id)
+            return None
+        self.index_chapters(item_id, item_data)
+        book = chapter_index.get_book(item_id) if chapter_index else None
+        if book:
+            return book['metadata'], book['parts'], chapter_index.get_chapters(item_id)
+        
+        # No index to keep it in; work the chapters out for this call only
+        from resources.lib.chapters import locate_chapters
+        media = item_data.get('media', {})
+        parts = [(audio_file['ino'], audio_file.get('duration') or 0) for audio_file in media.get('audioFiles', [])]
+        chapters = locate_chapters(media.get('chapters') or [], [duration for _, duration in parts])
+        return media.get('metadata', {}), parts, [(number,) + chapter for number, chapter in enumerate(chapters)]
+    
+    def list_chapters(self, item_id):
+        book = self.get_book_chapters(item_id)
+        if not book:
+            xbmcgui.Dialog().notification('Error', 'Could not load chapters', xbmcgui.NOTIFICATION_ERROR)
             return
-            
-        for item in data.get('results', []):
-            media = item.get('media', {})
-            metadata = media.get('metadata', {})
-            
-            if media_type == 'podcast':
-                # For podcasts, get detailed item data to get accurate episode count
-                detailed_item = self.api_get(f'/items/{item["id"]}')
-                if not detailed_item:
-                    continue
-                
-                title = metadata.get('title', 'Unknown Podcast')
-                description = self.clean_html(metadata.get('description', ''))
-                author = metadata.get('author', metadata.get('authorName', ''))
-                
-                # Get accurate episode count
-                episode_count = self.get_episode_count(detailed_item)
-                display_title = f'{title} ({episode_count} episodes)' if episode_count > 0 else title
-                
-                # Get additional podcast info
-                genres = metadata.get('genres', [])
-                genre_str = ', '.join(genres) if genres else ''
-                
-                li = xbmcgui.ListItem(display_title)
-                li.setInfo('music', {
-                    'title': title,
-                    'artist': author,
-                    'plot': description,  # Use plot instead of comment
-                    'genre': genre_str,
-                    'mediatype': 'album'
-                })
-                
-                # Set artwork with authentication
-                cover_url = self.get_cover_url(item['id'])
-                li.setArt({
-                    'thumb': cover_url,
-                    'icon': cover_url,
-                    'fanart': cover_url,
-                    'poster': cover_url
-                })
-                
-                url = f'{sys.argv[0]}?action=episodes&id={item["id"]}'
-                xbmcplugin.addDirectoryItem(self.handle, url, li, True)
-            else:
-                # For books
-                title = metadata.get('title', 'Unknown')
-                author = metadata.get('authorName', 'Unknown Author')
-                narrator = metadata.get('narratorName', '')
-                description = self.clean_html(metadata.get('description', ''))
-                duration = media.get('duration', 0)
-                
-                # Create display title with narrator if available
-                display_author = f'{author}'
-                if narrator and narrator != author:
-                    display_author += f' (Narrated by {narrator})'
-                
-                duration_str = self.format_duration(duration)
-                display_title = f'{title} - {display_author}'
+        metadata, _, chapters = book
+        title = metadata.get('title', 'Unknown')
+        author = metadata.get('authorName', 'Unknown Author')
+        
+        items = []
+        with self.metrics.span('build'):
+            art = self.get_art(item_id, poster=False)
+            for number, chapter_title, start, end, _, _ in chapters:
+                label = f'{number + 1}. {chapter_title}'
+                duration_str = self.format_duration(end - start)
                 if duration_str:
-                    display_title += f' [{duration_str}]'
-                
-                li = xbmcgui.ListItem(display_title)
+                    label += f' [{duration_str}]'
+                li = xbmcgui.ListItem(label, offscreen=True)
                 li.setInfo('music', {
-                    'title': title,
+                    'title': chapter_title,
                     'artist': author,
-                    'plot': description,  # Use plot instead of comment
-                    'duration': int(duration),
+                    'album': title,
+                    'duration': int(end - start),
+                    'tracknumber': number + 1,
                     'mediatype': 'song'
                 })
                 li.setProperty('IsPlayable', 'true')
-                
-                # Set artwork with authentication
-                cover_url = self.get_cover_url(item['id'])
-                li.setArt({
-                    'thumb': cover_url,
-                    'icon': cover_url,
-                    'fanart': cover_url,
-                    'poster': cover_url
-                })
-                
-                url = f'{sys.argv[0]}?action=play&id={item["id"]}&type=book'
-                xbmcplugin.addDirectoryItem(self.handle, url, li, False)
-        
-        xbmcplugin.endOfDirectory(self.handle)
+                li.setArt(art)
+                items.append((f'{sys.argv[0]}?action=play&id={item_id}&type=book&chapter={number}', li, False))
+        self.add_directory(items, 'songs')
     
-    def list_episodes(self, item_id):
-        data = self.api_get(f'/items/{item_id}')
-        if not data:
+    def play_chapter(self, item_id, number):
+        """Start a book at a chapter, resolving straight to the file and offset the chapter index holds"""
+        book = self.get_book_chapters(item_id)
+        chapter = next((chapter for chapter in book[2] if chapter[0] == number), None) if book else None
+        if not chapter:
+            xbmcgui.Dialog().notification('Error', 'Chapter not found', xbmcgui.NOTIFICATION_ERROR)
             return
-            
-        # Get podcast metadata
-        media = data.get('media', {})
-        podcast_metadata = media.get('metadata', {})
-        podcast_title = podcast_metadata.get('title', 'Unknown Podcast')
+        metadata, parts, _ = book
+        _, _, _, _, track, offset = chapter
+        urls = [self.get_file_url(item_id, ino) for ino, _ in parts]
         
-        # Try different possible episode locations
-        episodes = []
+        if len(parts) == 1:
+            duration = parts[0][1]
+            li = self.build_book_play_item(item_id, metadata, duration, urls[0])
+            li.setProperty('StartOffset', str(offset))
+            self.set_now_playing(item_id, None, duration, [(urls[0], 0)])
+            self.resolve(li)
+            return
         
-        if 'episodes' in media:
-            episodes = media['episodes']
-        elif 'episodes' in data:
-            episodes = data['episodes']
-        elif 'podcastEpisodes' in data:
-            episodes = data['podcastEpisodes']
+        # Seeking into a session's transcoded stream would make the server encode up to
+        # the chapter, so chapters always play the parts directly
+        self.play_parts(item_id, metadata, [{'duration': duration} for _, duration in parts], urls, track, offset)
+    
+    def set_now_playing(self, item_id, episode_id, duration, tracks, session_id=None):
+        """Describe what is about to play for the service's progress reporting.
         
-        if not episodes:
-            li = xbmcgui.ListItem('No episodes found')
-            xbmcplugin.addDirectoryItem(self.handle, '', li, False)
-            xbmcplugin.endOfDirectory(self.handle)
-            return
-            
-        # Get podcast cover URL for all episodes
-        podcast_cover_url = self.get_cover_url(item_id)
+        tracks lists (url, start offset in seconds) for each file or stream of the item.
+        """
+        xbmcgui.Window(10000).setProperty(NOW_PLAYING_PROPERTY, json.dumps({
+            'item_id': item_id,
+            'episode_id': episode_id,
+            'session_id': session_id,
+            'duration': duration or 0,
+            # Without the query, so no token ends up in a window property
+            'tracks': [[url.split('?')[0], offset] for url, offset in tracks],
+        }))
+    
+    def get_library_page_endpoint(self, lib_id, page, page_size):
+        endpoint = f'/libraries/{lib_id}/items?limit={page_size}&page={page}&include=rssfeed'
+        if self.get_mirror():
+            # Same order the mirror renders in, so pages stay consistent once it is built
+            endpoint += '&sort=media.metadata.title'
+        return endpoint
+    
+    def sync_library(self, lib_id, media_type, full=False):
+        """Bring the local mirror of a library up to date; returns False if the server failed us"""
+        mirror = self.get_mirror()
+        state = mirror.get_state(lib_id)
+        now = time.time()
+        if state and not full:
+            if now - state['synced_at'] < MIN_SYNC_INTERVAL:
+                return True
+            full = now - state['full_synced_at'] > FULL_SYNC_INTERVAL
         
-        for ep in sorted(episodes, key=lambda x: x.get('publishedAt', 0), reverse=True):
-            title = ep.get('title', ep.get('episodeTitle', 'Unknown Episode'))
-            description = self.clean_html(ep.get('description', ep.get('subtitle', '')))
+        if state and not full:
+            # Ask for the most recently updated items until we reach ones we already have
+            watermark = mirror.get_watermark(lib_id)
+            changed = []
+            page = 0
+            while True:
+                data = self.api_get(f'/libraries/{lib_id}/items?sort=updatedAt&desc=1'
+                                    f'&limit={DELTA_PAGE_SIZE}&page={page}', use_cache=False)
+                if not data:
+                    return False
+                results = data.get('results', [])
+                stamps = [item.get('updatedAt') or 0 for item in results]
+                if stamps != sorted(stamps, reverse=True):
+                    # Server ignored the sort, so a delta isn't possible
+                    full = True
+                    break
+                newer = [item for item in results if (item.get('updatedAt') or 0) > watermark]
+                changed.extend(newer)
+                if len(newer) < len(results) or (page + 1) * DELTA_PAGE_SIZE >= data.get('total', 0):
+                    break
+                page += 1
             
-            # Handle publishedAt as timestamp or string
-            pub_date = ''
-            pub_year = ''
-            if ep.get('publishedAt'):
-                pub_timestamp = ep.get('publishedAt')
-                if isinstance(pub_timestamp, int):
-                    import datetime
-                    dt = datetime.datetime.fromtimestamp(pub_timestamp / 1000)
-                    pub_date = dt.strftime('%Y-%m-%d')
-                    pub_year = dt.strftime('%Y')
-                elif isinstance(pub_timestamp, str):
-                    pub_date = pub_timestamp[:10]
-                    pub_year = pub_timestamp[:4]
+            if not full:
+                changed = mirror.upsert(lib_id, changed)
+                if data.get('total', 0) == mirror.count(lib_id):
+                    mirror.set_state(lib_id, data.get('total', 0))
+                    if changed:
+                        self.update_search_index(lib_id, media_type, changed)
+                    return True
+                # Counts disagree, so something was removed; reconcile by id with a full pass
+        
+        seen_ids = []
+        page = 0
+        while True:
+            data = self.api_get(f'/libraries/{lib_id}/items?limit={SYNC_PAGE_SIZE}&page={page}', use_cache=False)
+            if not data:
+                return False
+            results = data.get('results', [])
+            compact = mirror.upsert(lib_id, results)
+            seen_ids.extend(item['id'] for item in compact)
+            self.update_search_index(lib_id, media_type, compact)
+            if not results or (page + 1) * SYNC_PAGE_SIZE >= data.get('total', 0):
+                break
+            page += 1
+        
+        removed = mirror.remove_missing(lib_id, seen_ids)
+        if removed:
+            self.update_search_index(lib_id, media_type, [], removed)
+        mirror.set_state(lib_id, len(seen_ids), full=True)
+        return True
+    
+    def list_library_items(self, lib_id, media_type='book', page=0):
+        page_size = int(self.setting('page_size') or 100)
+        mirror = self.get_mirror()
+        has_mirror = bool(mirror and mirror.get_state(lib_id))
+        
+        if has_mirror:
+            # Render from the local copy; changes are picked up after the listing is shown
+            results = mirror.get_page(lib_id, page, page_size)
+            total = mirror.count(lib_id)
+            has_next_page = (page + 1) * page_size < total
+        else:
+            data = self.api_get(self.get_library_page_endpoint(lib_id, page, page_size))
+            if not data:
+                return
             
-            duration = ep.get('duration', ep.get('audioFile', {}).get('duration', 0))
-            duration_str = self.format_duration(duration) if duration else ''
+            results = data.get('results', [])
+            total = data.get('total', len(results))
+            has_next_page = (page + 1) * page_size < total
             
-            # Enhanced display title with duration
-            display_title = title
-            if pub_date:
-                display_title = f'{title} ({pub_date})'
-            if duration_str:
-                display_title += f' [{duration_str}]'
+            # Warm the cache with the next page while this one is being rendered,
+            # unless the mirror is about to be built and will serve it instead
+            if (has_next_page and self.cache and not mirror
+                    and self.setting('prefetch_next_page') != 'false'):
+                next_endpoint = self.get_library_page_endpoint(lib_id, page + 1, page_size)
+                threading.Thread(target=self.api_get, args=(next_endpoint,)).start()
+        
+        episode_counts = {}
+        if media_type == 'podcast':
+            # Episode counts come with the listing; only fetch details for items missing one
+            missing = []
+            for item in results:
+                count = self.get_episode_count(item)
+                if count is None:
+                    missing.append(item['id'])
+                else:
+                    episode_counts[item['id']] = count
             
-            li = xbmcgui.ListItem(display_title)
-            li.setInfo('music', {
-                'title': title,
-                'artist': podcast_title,
-                'album': podcast_title,
-                'plot': description,  # Use plot instead of comment
-                'date': pub_date,
-                'year': int(pub_year) if pub_year.isdigit() else 0,
-                'duration': int(duration) if duration else 0,
-                'mediatype': 'song'
-            })
-            li.setProperty('IsPlayable', 'true')
+            for item_id, detailed_item in self.fetch_items(missing).items():
+                if detailed_item:
+                    episode_counts[item_id] = self.get_episode_count(detailed_item) or 0
             
-            # Use podcast artwork for episodes
-            li.setArt({
-                'thumb': podcast_cover_url,
-                'icon': podcast_cover_url,
-                'fanart': podcast_cover_url
-            })
+        with self.metrics.span('build'):
+            items = []
+            if media_type == 'podcast':
+                for item in results:
+                    if item['id'] in episode_counts:
+                        items.append(self.build_podcast_item(item, episode_counts[item['id']]))
+            else:
+                items = [self.build_book_item(item) for item in results]
+        
+        if has_next_page:
+            page_count = (total + page_size - 1) // page_size
+            li = xbmcgui.ListItem(f'Next page ({page + 2}/{page_count})', offscreen=True)
+            li.setProperty('SpecialSort', 'bottom')
+            url = f'{sys.argv[0]}?action=library&id={lib_id}&type={media_type}&page={page + 1}'
+            items.append((url, li, True))
+        
+        if media_type == 'podcast':
+            self.add_directory(items, 'albums', PODCAST_SORT_METHODS)
+        else:
+            self.add_directory(items, 'songs', BOOK_SORT_METHODS)
+        
+        # Sync, index and fetch covers after the listing is shown so none of it slows down browsing
+        if mirror:
+            self.sync_library(lib_id, media_type)
+        else:
+            self.update_search_index(lib_id, media_type, results)
+        self.warm_covers([item['id'] for item in results])
+    
+    def search(self, query=None):
+        search_index = self.get_search_index()
+        if not search_index:
+            xbmcgui.Dialog().notification('Error', 'Search is disabled', xbmcgui.NOTIFICATION_ERROR)
+            xbmcplugin.endOfDirectory(self.handle, succeeded=False)
+            return
+        
+        if query is None:
+            query = xbmcgui.Dialog().input('Search titles, authors, narrators, series')
+        if not query:
+            xbmcplugin.endOfDirectory(self.handle, succeeded=False)
+            return
+        
+        items = []
+        item_ids = []
+        with self.metrics.span('build'):
+            for media_type, item in search_index.search(query, SEARCH_LIMIT):
+                item_ids.append(item['id'])
+                if media_type == 'podcast':
+                    items.append(self.build_podcast_item(item, self.get_episode_count(item) or 0))
+                else:
+                    items.append(self.build_book_item(item))
+        
+        if not items:
+            xbmcgui.Dialog().notification('Audiobookshelf', f'No results for "{query}"', xbmcgui.NOTIFICATION_INFO)
+        self.add_directory(items, 'songs', BOOK_SORT_METHODS)
+        self.warm_covers(item_ids)
+    
+    def index_episodes(self, item_id):
+        """Fetch a podcast and store its episode list in the index; returns the podcast row or None"""
+        from resources.lib.stream import EpisodeRecord
+        index = self.get_episode_index()
+        store = lambda records: index.replace(item_id, records)
+        if self.use_streaming():
+            count, data = self.stream_episodes(item_id, store)
+        else:
+            data = self.api_get(f'/items/{item_id}')
+            count = store(EpisodeRecord.from_json(ep) for ep in self.get_episodes(data) or []) if data else 0
+        if not data:
+            return None
+        
+        title = data.get('media', {}).get('metadata', {}).get('title', 'Unknown Podcast')
+        index.set_podcast(item_id, title, count)
+        return index.get_podcast(item_id)
+    
+    def get_podcast_index(self, item_id):
+        """Indexed podcast row, refreshed when older than EPISODE_INDEX_TTL; None if unavailable"""
+        index = self.get_episode_index()
+        if not index:
+            return None
+        podcast = index.get_podcast(item_id)
+        if not podcast or time.time() - podcast['fetched_at'] > EPISODE_INDEX_TTL:
+            try:
+                # Keep serving the old copy if the server can't be reached
+                podcast = self.index_episodes(item_id) or podcast
+            except Exception as e:
+                xbmc.log(f'Episode index update failed: {str(e)}', xbmc.LOGWARNING)
+        return podcast
+    
+    def list_episodes(self, item_id, page=0):
+        page_size = int(self.setting('episode_page_size') or 100)
+        podcast = self.get_podcast_index(item_id)
+        if podcast:
+            podcast_title = podcast['title']
+            total = podcast['count']
+            episodes = self.episode_index.get_page(item_id, page, page_size)
+        else:
+            # No index to page from; keep only the episodes up to this page
+            from resources.lib.stream import EpisodeRecord, select_newest
+            limit = (page + 1) * page_size
+            if self.use_streaming():
+                episodes, data = self.stream_episodes(item_id, lambda records: select_newest(records, limit))
+            else:
+                data = self.api_get(f'/items/{item_id}')
+                episodes = self.get_episodes(data) if data else None
+                episodes = select_newest((EpisodeRecord.from_json(ep) for ep in episodes or []), limit)
+            if not data:
+                return
+            podcast_title = data.get('media', {}).get('metadata', {}).get('title', 'Unknown Podcast')
+            total = self.get_episode_count(data) or 0
+            episodes = episodes[page * page_size:]
+        
+        if not episodes:
+            li = xbmcgui.ListItem('No episodes found')
+            self.add_directory([('', li, False)])
+            return
             
-            ep_id = ep.get('id', ep.get('episodeId', ''))
-            url = f'{sys.argv[0]}?action=play&id={item_id}&episode={ep_id}&type=podcast'
-            xbmcplugin.addDirectoryItem(self.handle, url, li, False)
+        # Every episode uses the podcast artwork
+        art = self.get_art(item_id, poster=False)
         
-        xbmcplugin.endOfDirectory(self.handle)
+        # Plot text and dates are only worked out for the page being shown
+        with self.metrics.span('build'):
+            items = [self.build_episode_item(ep, item_id, podcast_title, art) for ep in episodes]
+        
+        shown = page * page_size + len(episodes)
+        if shown < total:
+            li = xbmcgui.ListItem(f'More episodes ({shown}/{total})', offscreen=True)
+            li.setProperty('SpecialSort', 'bottom')
+            url = f'{sys.argv[0]}?action=episodes&id={item_id}&page={page + 1}'
+            items.append((url, li, True))
+        
+        self.add_directory(items, 'songs', EPISODE_SORT_METHODS)
+        self.warm_covers([item_id], fanart=True)
+    
+    def build_podcast_item(self, item, episode_count):
+        """Build the (url, ListItem, isFolder) tuple for a podcast in a library listing"""
+        metadata = item.get('media', {}).get('metadata', {})
+        title = metadata.get('title', 'Unknown Podcast')
+        description = self.clean_html(metadata.get('description', ''))
+        author = metadata.get('author', metadata.get('authorName', ''))
+        display_title = f'{title} ({episode_count} episodes)' if episode_count > 0 else title
+        
+        # Get additional podcast info
+        genres = metadata.get('genres', [])
+        genre_str = ', '.join(genres) if genres else ''
+        
+        li = xbmcgui.ListItem(display_title, offscreen=True)
+        li.setInfo('music', {
+            'title': title,
+            'artist': author,
+            'plot': description,  # Use plot instead of comment
+            'genre': genre_str,
+            'mediatype': 'album'
+        })
+        li.setArt(self.get_art(item['id']))
+        
+        url = f'{sys.argv[0]}?action=episodes&id={item["id"]}'
+        return url, li, True
+    
+    def build_book_item(self, item):
+        """Build the (url, ListItem, isFolder) tuple for a book in a library listing"""
+        media = item.get('media', {})
+        metadata = media.get('metadata', {})
+        title = metadata.get('title', 'Unknown')
+        author = metadata.get('authorName', 'Unknown Author')
+        narrator = metadata.get('narratorName', '')
+        description = self.clean_html(metadata.get('description', ''))
+        duration = media.get('duration', 0)
+        
+        # Create display title with narrator if available
+        display_author = f'{author}'
+        if narrator and narrator != author:
+            display_author += f' (Narrated by {narrator})'
+        
+        duration_str = self.format_duration(duration)
+        display_title = f'{title} - {display_author}'
+        if duration_str:
+            display_title += f' [{duration_str}]'
+        
+        li = xbmcgui.ListItem(display_title, offscreen=True)
+        li.setInfo('music', {
+            'title': title,
+            'artist': author,
+            'plot': description,  # Use plot instead of comment
+            'duration': int(duration),
+            'mediatype': 'song'
+        })
+        li.setProperty('IsPlayable', 'true')
+        li.setArt(self.get_art(item['id']))
+        li.addContextMenuItems([
+            ('Chapters', f'Container.Update({sys.argv[0]}?action=chapters&id={item["id"]})'),
+            ('Download', f'RunPlugin({sys.argv[0]}?action=download&id={item["id"]})')])
+        
+        url = f'{sys.argv[0]}?action=play&id={item["id"]}&type=book'
+        return url, li, False
+    
+    def build_episode_item(self, ep, item_id, podcast_title, art):
+        """Build the (url, ListItem, isFolder) tuple for a podcast episode (an EpisodeRecord)"""
+        title = ep.title
+        description = self.clean_html(ep.description)
+        
+        # Handle publishedAt as timestamp or string
+        pub_date = ''
+        pub_year = ''
+        if ep.published_at:
+            pub_timestamp = ep.published_at
+            if isinstance(pub_timestamp, int):
+                published = time.localtime(pub_timestamp / 1000)
+                pub_date = time.strftime('%Y-%m-%d', published)
+                pub_year = time.strftime('%Y', published)
+            elif isinstance(pub_timestamp, str):
+                pub_date = pub_timestamp[:10]
+                pub_year = pub_timestamp[:4]
+        
+        duration = ep.duration
+        duration_str = self.format_duration(duration) if duration else ''
+        
+        # Enhanced display title with duration
+        display_title = title
+        if pub_date:
+            display_title = f'{title} ({pub_date})'
+        if duration_str:
+            display_title += f' [{duration_str}]'
+        
+        li = xbmcgui.ListItem(display_title, offscreen=True)
+        li.setInfo('music', {
+            'title': title,
+            'artist': podcast_title,
+            'album': podcast_title,
+            'plot': description,  # Use plot instead of comment
+            'date': pub_date,
+            'year': int(pub_year) if pub_year.isdigit() else 0,
+            'duration': int(duration) if duration else 0,
+            'mediatype': 'song'
+        })
+        li.setProperty('IsPlayable', 'true')
+        li.setArt(art)
+        
+        li.addContextMenuItems([
+            ('Download', f'RunPlugin({sys.argv[0]}?action=download&id={item_id}&episode={ep.id})')])
+        
+        url = f'{sys.argv[0]}?action=play&id={item_id}&episode={ep.id}&type=podcast'
+        return url, li, False
+    
+    def add_directory(self, items, content=None, sort_methods=()):
+        """Hand a whole listing to Kodi in one call and close the directory"""
+        self.metrics.count('items', len(items))
+        with self.metrics.span('render'):
+            if content:
+                xbmcplugin.setContent(self.handle, content)
+            for sort_method in sort_methods:
+                xbmcplugin.addSortMethod(self.handle, sort_method)
+            xbmcplugin.addDirectoryItems(self.handle, items, len(items))
+            started = time.perf_counter()
+            xbmcplugin.endOfDirectory(self.handle)
+            self.metrics.add('endOfDirectory', time.perf_counter() - started)
+    
+    def resolve(self, li):
+        """Hand Kodi the item to play"""
+        with self.metrics.span('render'):
+            xbmcplugin.setResolvedUrl(self.handle, True, li)
     
     def router(self, params):
         if not params:
             self.list_libraries()
         elif params['action'] == 'library':
             media_type = params.get('type', 'book')
-            self.list_library_items(params['id'], media_type)
+            page = int(params.get('page', 0))
+            self.list_library_items(params['id'], media_type, page)
         elif params['action'] == 'episodes':
-            self.list_episodes(params['id'])
+            page = int(params.get('page', 0))
+            self.list_episodes(params['id'], page)
         elif params['action'] == 'play':
             media_type = params.get('type', 'book')
             episode_id = params.get('episode')
-            self.play_item(params['id'], media_type, episode_id)
+            if 'chapter' in params:
+                self.play_chapter(params['id'], int(params['chapter']))
+            else:
+                self.play_item(params['id'], media_type, episode_id)
+        elif params['action'] == 'widget':
+            self.list_widget(params.get('kind', 'in_progress'))
+        elif params['action'] == 'chapters':
+            self.list_chapters(params['id'])
+        elif params['action'] == 'search':
+            self.search(params.get('query'))
+        elif params['action'] == 'clear_cache':
+            self.clear_cache()
+        elif params['action'] == 'downloads':
+            self.list_downloads()
+        elif params['action'] == 'download':
+            self.download(params['id'], params.get('episode'))
+        elif params['action'] == 'delete_download':
+            self.delete_download(params['id'], params.get('episode'))
 
 def run():
+    metrics = Instrumentation(START_TIME)
+    metrics.mark('import')
     params = dict(urlparse.parse_qsl(sys.argv[2][1:]))
-    plugin = AudiobookshelfPlugin()
-    plugin.router(params)
+    action = params.get('action', 'home')
+    plugin = AudiobookshelfPlugin(metrics=metrics)
+    metrics.keep_events = plugin.setting('trace_file') == 'true'
+    metrics.mark('init')
+    
+    if plugin.setting('cprofile') == 'true':
+        profile_call(os.path.join(plugin.profile_dir, 'profiles'), action, plugin.router, params)
+    else:
+        plugin.router(params)
+    metrics.mark('route')
+    
+    if plugin.setting('startup_timing') == 'true':
+        xbmc.log(f'Audiobookshelf {action}: {metrics.summary()}', xbmc.LOGINFO)
+    if metrics.keep_events:
+        try:
+            append_trace(os.path.join(plugin.profile_dir, 'traces.jsonl'), metrics.record(action=action, params=params))
+        except Exception as e:
+            xbmc.log(f'Could not write trace: {str(e)}', xbmc.LOGWARNING)
 
 if __name__ == '__main__':
     run()
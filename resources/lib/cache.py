@@ -0,0 +1,83 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class CacheEntry:
+    __slots__ = ('body', 'etag', 'last_modified', 'stored')
+
+    def __init__(self, body, etag, last_modified, stored):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored
+
+    def is_fresh(self, ttl):
+        return time.time() - self.stored < ttl
+
+
+class ResponseCache:
+    """Size-bounded LRU cache of raw API responses, stored in SQLite"""
+
+    def __init__(self, path, max_bytes):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            body BLOB NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            stored REAL NOT NULL,
+            accessed REAL NOT NULL,
+            size INTEGER NOT NULL)''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+        self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute(
+                'SELECT body, etag, last_modified, stored FROM responses WHERE key = ?', (key,)).fetchone()
+            if not row:
+                return None
+            self.db.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+            self.db.commit()
+        body, etag, last_modified, stored = row
+        return CacheEntry(zlib.decompress(body), etag, last_modified, stored)
+
+    def put(self, key, body, etag=None, last_modified=None):
+        packed = zlib.compress(body)
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, packed, etag, last_modified, now, now, len(packed)))
+            self._evict()
+            self.db.commit()
+
+    def refresh(self, key):
+        """Mark an entry as freshly validated (e.g. after a 304 response)"""
+        now = time.time()
+        with self.lock:
+            self.db.execute('UPDATE responses SET stored = ?, accessed = ? WHERE key = ?', (now, now, key))
+            self.db.commit()
+
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM responses')
+            self.db.commit()
+            self.db.execute('VACUUM')
+
+    def _evict(self):
+        # Drop least recently used entries until we fit in max_bytes
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.db.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall():
+            self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
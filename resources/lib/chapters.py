@@ -0,0 +1,96 @@
+import json
+import os
+import sqlite3
+import time
+
+# Books indexed longer ago than this are fetched again when their chapters are listed
+CHAPTER_TTL = 7 * 24 * 3600
+
+# A chapter starting this close to the end of a file belongs to the next one
+BOUNDARY_SLACK = 0.5
+
+
+def locate_chapters(chapters, durations):
+    """(title, start, end, track, offset) for each chapter, in book order.
+
+    start and end are positions in the whole book; track is the index of the
+    audio file the chapter starts in and offset the position within that file,
+    all in seconds.
+    """
+    located = []
+    track = 0
+    track_start = 0
+    for chapter in sorted(chapters, key=lambda chapter: chapter.get('start') or 0):
+        start = chapter.get('start') or 0
+        while track < len(durations) - 1 and start >= track_start + durations[track] - BOUNDARY_SLACK:
+            track_start += durations[track]
+            track += 1
+        title = chapter.get('title') or f'Chapter {len(located) + 1}'
+        located.append((title, start, chapter.get('end') or start, track, max(start - track_start, 0)))
+    return located
+
+
+class ChapterIndex:
+    """Books' audio files and chapters, with each chapter already mapped to a file and offset"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=5)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS books (
+            item_id TEXT PRIMARY KEY,
+            metadata TEXT NOT NULL,
+            parts TEXT NOT NULL,
+            updated_at INTEGER,
+            fetched_at REAL NOT NULL)''')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS chapters (
+            item_id TEXT NOT NULL,
+            number INTEGER NOT NULL,
+            title TEXT,
+            start REAL NOT NULL,
+            end REAL NOT NULL,
+            track INTEGER NOT NULL,
+            offset REAL NOT NULL,
+            PRIMARY KEY (item_id, number))''')
+        self.db.commit()
+
+    def update(self, item_id, item_data):
+        """Index a book from its /items/{id} response; unchanged books only get a new fetched_at"""
+        updated_at = item_data.get('updatedAt')
+        with self.db:
+            row = self.db.execute('SELECT updated_at FROM books WHERE item_id = ?', (item_id,)).fetchone()
+            if row and updated_at is not None and row[0] == updated_at:
+                self.db.execute('UPDATE books SET fetched_at = ? WHERE item_id = ?', (time.time(), item_id))
+                return
+            media = item_data.get('media', {})
+            metadata = media.get('metadata', {})
+            parts = [(audio_file['ino'], audio_file.get('duration') or 0) for audio_file in media.get('audioFiles', [])]
+            chapters = locate_chapters(media.get('chapters') or [], [duration for _, duration in parts])
+            self.db.execute('INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?)', (
+                item_id,
+                json.dumps({key: metadata.get(key) for key in ('title', 'authorName', 'description') if metadata.get(key)}),
+                json.dumps(parts), updated_at, time.time()))
+            self.db.execute('DELETE FROM chapters WHERE item_id = ?', (item_id,))
+            self.db.executemany('INSERT INTO chapters VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                [(item_id, number) + chapter for number, chapter in enumerate(chapters)])
+
+    def get_book(self, item_id):
+        """{'metadata', 'parts': [(ino, duration)], 'fetched_at'} for an indexed book, else None"""
+        row = self.db.execute('SELECT metadata, parts, fetched_at FROM books WHERE item_id = ?', (item_id,)).fetchone()
+        if not row:
+            return None
+        return {'metadata': json.loads(row[0]), 'parts': [tuple(part) for part in json.loads(row[1])],
+                'fetched_at': row[2]}
+
+    def is_stale(self, book):
+        return time.time() - book['fetched_at'] > CHAPTER_TTL
+
+    def get_chapters(self, item_id):
+        """(number, title, start, end, track, offset) for each of a book's chapters"""
+        return self.db.execute(
+            'SELECT number, title, start, end, track, offset FROM chapters WHERE item_id = ? ORDER BY number',
+            (item_id,)).fetchall()
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM books')
+            self.db.execute('DELETE FROM chapters')
@@ -0,0 +1,90 @@
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth another attempt for idempotent requests
+RETRY_STATUSES = (502, 503, 504)
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of contacting a server already known to be unreachable"""
+
+
+class CircuitBreaker:
+    """Opens after a number of consecutive connection failures.
+
+    After reset_after seconds it lets requests through again, so a long-running
+    service notices when the server comes back.
+    """
+
+    def __init__(self, failure_threshold=2, reset_after=30):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return (self.failures >= self.failure_threshold
+                and time.monotonic() - self.opened_at < self.reset_after)
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class HttpClient:
+    """Shared keep-alive session with retries and a circuit breaker"""
+
+    def __init__(self, pool_size=8, retries=2, backoff=0.4, failure_threshold=2):
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = CircuitBreaker(failure_threshold)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, timeout, **kwargs):
+        return self.request('GET', url, timeout, idempotent=True, **kwargs)
+
+    def post(self, url, timeout, **kwargs):
+        return self.request('POST', url, timeout, idempotent=False, **kwargs)
+
+    def patch(self, url, timeout, **kwargs):
+        return self.request('PATCH', url, timeout, idempotent=False, **kwargs)
+
+    def request(self, method, url, timeout, idempotent=False, **kwargs):
+        attempts = self.retries + 1 if idempotent else 1
+        for attempt in range(attempts):
+            if self.breaker.is_open:
+                raise CircuitOpenError(f'Server unreachable, skipping {method} {url}')
+
+            last_attempt = attempt == attempts - 1
+            try:
+                resp = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.ConnectionError:
+                # Includes ConnectTimeout; a read timeout means the server is up but slow
+                self.breaker.record_failure()
+                if last_attempt or self.breaker.is_open:
+                    raise
+            else:
+                self.breaker.record_success()
+                if resp.status_code not in RETRY_STATUSES or last_attempt:
+                    return resp
+
+            # Full jitter keeps concurrent workers from retrying in lockstep
+            time.sleep(random.uniform(0, self.backoff * (2 ** attempt)))
+
+    def close(self):
+        self.session.close()
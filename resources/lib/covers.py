@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+
+# Downloaded covers older than this are fetched again when warmed
+COVER_TTL = 30 * 24 * 3600
+
+
+class CoverCache:
+    """Resized cover images stored in the profile folder.
+
+    Kodi's texture cache is keyed by image path, so a local file keeps the same
+    key for good, where a server URL changed with every new token. fetch(item_id,
+    width) returns the image bytes or None.
+    """
+
+    def __init__(self, directory, fetch, max_bytes, workers=4):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fetch = fetch
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.names = None
+
+    def get_name(self, item_id, width):
+        return f'{item_id}-{width}.jpg'
+
+    def get_names(self):
+        """Names of the covers on disk, listed once and then kept up to date"""
+        if self.names is None:
+            self.names = {name for name in os.listdir(self.directory) if name.endswith('.jpg')}
+        return self.names
+
+    def get(self, item_id, width):
+        """Local path of a cover if it has been downloaded, else None"""
+        name = self.get_name(item_id, width)
+        return os.path.join(self.directory, name) if name in self.get_names() else None
+
+    def is_stale(self, name):
+        if name not in self.get_names():
+            return True
+        try:
+            return time.time() - os.path.getmtime(os.path.join(self.directory, name)) > COVER_TTL
+        except OSError:
+            return True
+
+    def download(self, item_id, width):
+        name = self.get_name(item_id, width)
+        body = self.fetch(item_id, width)
+        if not body:
+            return 0
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(body)
+        os.replace(path + '.tmp', path)
+        with self.lock:
+            self.get_names().add(name)
+        return len(body)
+
+    def warm(self, item_ids, width):
+        """Download the missing or stale covers among item_ids concurrently; returns how many"""
+        missing = [item_id for item_id in dict.fromkeys(item_ids) if self.is_stale(self.get_name(item_id, width))]
+        if not missing:
+            return 0
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(missing))) as pool:
+            downloaded = sum(1 for size in pool.map(lambda item_id: self.download(item_id, width), missing) if size)
+        if downloaded:
+            self.trim()
+        return downloaded
+
+    def trim(self):
+        """Delete the least recently downloaded covers while the folder is over max_bytes"""
+        entries = [(entry.stat(), entry) for entry in os.scandir(self.directory) if entry.name.endswith('.jpg')]
+        total = sum(stat.st_size for stat, _ in entries)
+        for stat, entry in sorted(entries, key=lambda pair: pair[0].st_mtime):
+            if total <= self.max_bytes:
+                break
+            os.remove(entry.path)
+            total -= stat.st_size
+            with self.lock:
+                self.get_names().discard(entry.name)
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            os.remove(entry.path)
+        with self.lock:
+            self.names = set()
@@ -0,0 +1,262 @@
+import os
+import sqlite3
+import threading
+import time
+
+# Bytes per Range request; a failed or interrupted transfer resumes at segment granularity
+SEGMENT_SIZE = 8 * 1024 * 1024
+
+# Bytes read from the response between rate limiting and abort checks
+CHUNK_SIZE = 64 * 1024
+
+
+class DownloadError(Exception):
+    """A segment or file did not come back the way the server described it"""
+
+
+class TokenBucket:
+    """Shared bandwidth cap in bytes per second; 0 means unlimited"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowance = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, size, stop):
+        if not self.rate:
+            return
+        while not stop.is_set():
+            with self.lock:
+                now = time.monotonic()
+                # Allow at most one second of burst
+                self.allowance = min(self.rate, self.allowance + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.allowance >= size or self.allowance >= self.rate:
+                    self.allowance -= size
+                    return
+                wait = (size - self.allowance) / self.rate
+            stop.wait(min(wait, 0.5))
+
+
+class DownloadStore:
+    """Which files are wanted offline, where they live and which of their segments are done"""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(directory, 'downloads.db'), timeout=5, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS files (
+            item_id TEXT NOT NULL,
+            episode_id TEXT NOT NULL,
+            ino TEXT NOT NULL,
+            track INTEGER NOT NULL,
+            title TEXT,
+            url TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            duration REAL,
+            status TEXT NOT NULL,
+            added_at REAL NOT NULL,
+            PRIMARY KEY (item_id, episode_id, ino))''')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS segments (
+            path TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            PRIMARY KEY (path, start))''')
+        self.db.commit()
+
+    def add(self, item_id, episode_id, title, files):
+        """Queue files in track order, given as (ino, url path, size or 0, extension, duration) tuples"""
+        folder = os.path.join(self.directory, item_id)
+        rows = [(item_id, episode_id or '', ino, track, title, url,
+                 os.path.join(folder, f'{episode_id or "book"}-{ino}{ext}'), size, duration, 'queued', time.time())
+                for track, (ino, url, size, ext, duration) in enumerate(files)]
+        with self.lock, self.db:
+            # Keep finished files; requeue anything that failed
+            self.db.executemany(
+                'INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (item_id, episode_id, ino) DO UPDATE SET status = excluded.status '
+                "WHERE files.status = 'failed'", rows)
+        return len(rows)
+
+    def get_local_path(self, item_id, ino, episode_id=None):
+        """Path of a finished download that is still on disk, else None"""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT path, size FROM files WHERE item_id = ? AND episode_id = ? AND ino = ? AND status = 'done'",
+                (item_id, episode_id or '', ino)).fetchone()
+        if row and os.path.exists(row[0]) and os.path.getsize(row[0]) == row[1]:
+            return row[0]
+        return None
+
+    def get_files(self, item_id, episode_id=None):
+        """(path, title, duration) of an item's finished files in track order; empty unless all are done"""
+        with self.lock:
+            rows = self.db.execute(
+                'SELECT path, title, duration, status FROM files WHERE item_id = ? AND episode_id = ? ORDER BY track',
+                (item_id, episode_id or '')).fetchall()
+        if not rows or any(row[3] != 'done' or not os.path.exists(row[0]) for row in rows):
+            return []
+        return [row[:3] for row in rows]
+
+    def get_items(self):
+        """(item_id, episode_id, title, files, files done, bytes, bytes done) per download, newest first"""
+        with self.lock:
+            files = self.db.execute(
+                'SELECT item_id, episode_id, title, status, path, size FROM files ORDER BY added_at DESC').fetchall()
+            segments = dict(self.db.execute('SELECT path, COUNT(*) FROM segments GROUP BY path'))
+        items = {}
+        for item_id, episode_id, title, status, path, size in files:
+            entry = items.setdefault((item_id, episode_id), [item_id, episode_id or None, title, 0, 0, 0, 0])
+            entry[3] += 1
+            entry[5] += size
+            if status == 'done':
+                entry[4] += 1
+                entry[6] += size
+            else:
+                entry[6] += min(segments.get(path, 0) * SEGMENT_SIZE, size)
+        return [tuple(entry) for entry in items.values()]
+
+    def next_file(self):
+        """Oldest file still to download as (path, url, size), or None"""
+        with self.lock:
+            return self.db.execute(
+                "SELECT path, url, size FROM files WHERE status IN ('queued', 'downloading') "
+                'ORDER BY added_at LIMIT 1').fetchone()
+
+    def set_size(self, path, size):
+        with self.lock, self.db:
+            self.db.execute('UPDATE files SET size = ? WHERE path = ?', (size, path))
+
+    def set_status(self, path, status):
+        with self.lock, self.db:
+            self.db.execute('UPDATE files SET status = ? WHERE path = ?', (status, path))
+            if status == 'done':
+                self.db.execute('DELETE FROM segments WHERE path = ?', (path,))
+
+    def get_done_segments(self, path):
+        with self.lock:
+            return {row[0] for row in self.db.execute('SELECT start FROM segments WHERE path = ?', (path,))}
+
+    def clear_segments(self, path):
+        with self.lock, self.db:
+            self.db.execute('DELETE FROM segments WHERE path = ?', (path,))
+
+    def add_segment(self, path, start):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR IGNORE INTO segments VALUES (?, ?)', (path, start))
+
+    def remove(self, item_id, episode_id=None):
+        with self.lock, self.db:
+            paths = [row[0] for row in self.db.execute(
+                'SELECT path FROM files WHERE item_id = ? AND episode_id = ?', (item_id, episode_id or ''))]
+            self.db.executemany('DELETE FROM segments WHERE path = ?', [(path,) for path in paths])
+            self.db.execute('DELETE FROM files WHERE item_id = ? AND episode_id = ?', (item_id, episode_id or ''))
+        for path in paths:
+            for name in (path, path + '.part'):
+                if os.path.exists(name):
+                    os.remove(name)
+        folder = os.path.join(self.directory, item_id)
+        if os.path.isdir(folder) and not os.listdir(folder):
+            os.rmdir(folder)
+
+
+class DownloadManager:
+    """Works through the store's queue on a background thread, one file at a time.
+
+    Each file is split into SEGMENT_SIZE Range requests fetched by up to workers
+    threads and written in place into path.part. fetch(url, start, end) returns
+    (total size from Content-Range, iterable of chunks) for that byte range.
+    """
+
+    def __init__(self, store, fetch, workers=3, rate=0):
+        self.store = store
+        self.fetch = fetch
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def is_running(self):
+        return bool(self.thread and self.thread.is_alive())
+
+    def start(self):
+        """Process the queue unless that is already happening"""
+        with self.lock:
+            if not self.is_running:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        thread = self.thread
+        if thread:
+            thread.join(10)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            with self.lock:
+                row = self.store.next_file()
+                if not row:
+                    # Cleared under the lock, so a file queued after this check gets a new worker
+                    self.thread = None
+                    return
+            path, url, size = row
+            self.store.set_status(path, 'downloading')
+            try:
+                self.download(path, url, size)
+            except Exception:
+                if self.stop_event.is_set():
+                    # Interrupted, not failed; resume from the finished segments next time
+                    return
+                # Stays failed until it is queued again
+                self.store.set_status(path, 'failed')
+
+    def download(self, path, url, size):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part = path + '.part'
+        if not size:
+            size, chunks = self.fetch(url, 0, 0)
+            for _ in chunks:
+                pass
+            self.store.set_size(path, size)
+        if not os.path.exists(part) or os.path.getsize(part) != size:
+            # Nothing to resume from; forget segments recorded for an earlier partial file
+            self.store.clear_segments(path)
+            with open(part, 'wb') as f:
+                f.truncate(size)
+
+        done = self.store.get_done_segments(path)
+        starts = [start for start in range(0, size, SEGMENT_SIZE) if start not in done]
+        if starts:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(starts))) as pool:
+                for _ in pool.map(lambda start: self.download_segment(path, url, start, size), starts):
+                    pass
+
+        missing = set(range(0, size, SEGMENT_SIZE)) - self.store.get_done_segments(path)
+        if missing:
+            raise DownloadError(f'{path}: {len(missing)} segments missing')
+        os.replace(part, path)
+        self.store.set_status(path, 'done')
+
+    def download_segment(self, path, url, start, size):
+        end = min(start + SEGMENT_SIZE, size) - 1
+        total, chunks = self.fetch(url, start, end)
+        if total != size:
+            raise DownloadError(f'{url}: server reports {total} bytes, expected {size}')
+        written = 0
+        with open(path + '.part', 'r+b') as f:
+            f.seek(start)
+            for chunk in chunks:
+                if self.stop_event.is_set():
+                    raise DownloadError('Stopped')
+                self.bucket.consume(len(chunk), self.stop_event)
+                f.write(chunk)
+                written += len(chunk)
+        if written != end - start + 1:
+            raise DownloadError(f'{url}: got {written} bytes for {start}-{end}')
+        self.store.add_segment(path, start)
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import time
+
+from resources.lib.stream import EpisodeRecord, published_sort_key
+
+# Rows written per executemany while a podcast is being indexed
+BATCH_SIZE = 500
+
+
+class EpisodeIndex:
+    """Per-podcast episode lists, newest first, so listing pages and playback need no refetch"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=5)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS podcasts (
+            item_id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            fetched_at REAL NOT NULL)''')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS episodes (
+            item_id TEXT NOT NULL,
+            episode_id TEXT NOT NULL,
+            sort_key INTEGER NOT NULL,
+            title TEXT,
+            description TEXT,
+            published_at,
+            duration REAL,
+            ino TEXT,
+            PRIMARY KEY (item_id, episode_id))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS episodes_newest ON episodes (item_id, sort_key DESC)')
+        self.db.commit()
+
+    def get_podcast(self, item_id):
+        row = self.db.execute(
+            'SELECT title, count, fetched_at FROM podcasts WHERE item_id = ?', (item_id,)).fetchone()
+        if not row:
+            return None
+        return {'title': row[0], 'count': row[1], 'fetched_at': row[2]}
+
+    def replace(self, item_id, records):
+        """Store a podcast's episodes from an iterable of EpisodeRecords, returning the count.
+
+        The podcast stays unlisted until set_podcast is called, so a failed
+        refresh never looks complete.
+        """
+        with self.db:
+            self.db.execute('DELETE FROM podcasts WHERE item_id = ?', (item_id,))
+            self.db.execute('DELETE FROM episodes WHERE item_id = ?', (item_id,))
+            count = 0
+            batch = []
+            for record in records:
+                batch.append(self.to_row(item_id, record))
+                if len(batch) >= BATCH_SIZE:
+                    count += self.insert(batch)
+                    batch = []
+            if batch:
+                count += self.insert(batch)
+        return count
+
+    def set_podcast(self, item_id, title, count):
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO podcasts VALUES (?, ?, ?, ?)',
+                            (item_id, title, count, time.time()))
+
+    def get_page(self, item_id, page, page_size):
+        rows = self.db.execute(
+            'SELECT episode_id, title, description, published_at, duration, ino FROM episodes '
+            'WHERE item_id = ? ORDER BY sort_key DESC LIMIT ? OFFSET ?',
+            (item_id, page_size, page * page_size))
+        return [self.from_row(row) for row in rows]
+
+    def get_episode(self, item_id, episode_id):
+        row = self.db.execute(
+            'SELECT episode_id, title, description, published_at, duration, ino FROM episodes '
+            'WHERE item_id = ? AND episode_id = ?', (item_id, episode_id)).fetchone()
+        return self.from_row(row) if row else None
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM podcasts')
+            self.db.execute('DELETE FROM episodes')
+
+    def insert(self, rows):
+        self.db.executemany('INSERT OR REPLACE INTO episodes VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def to_row(self, item_id, record):
+        # published_at has no declared type, so epoch ms and ISO strings both round-trip
+        return (item_id, record.id, int(published_sort_key(record.published_at)), record.title,
+                record.description, record.published_at, record.duration, record.ino)
+
+    def from_row(self, row):
+        return EpisodeRecord(*row)
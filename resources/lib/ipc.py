@@ -0,0 +1,59 @@
+import socket
+import urllib.parse
+
+# Home window property the service publishes "port:secret" under while it runs
+SERVICE_PROPERTY = 'plugin.audio.audiobookshelf.service'
+
+# Home window property the plugin describes the stream it just resolved under, as JSON,
+# so the service's player monitor can report progress for it
+NOW_PLAYING_PROPERTY = 'plugin.audio.audiobookshelf.playing'
+
+# Home window property the plugin updates after queueing downloads, so the service starts them
+DOWNLOADS_PROPERTY = 'plugin.audio.audiobookshelf.downloads'
+
+# Home window property the service sets to the widget snapshot's time after each refresh.
+# Skins can add &reload=$INFO[Window(Home).Property(...)] to widget paths to reload on change
+WIDGETS_PROPERTY = 'plugin.audio.audiobookshelf.widgets'
+
+# Generous enough for the service to make its own request to the server
+CLIENT_TIMEOUT = 30
+
+
+class IpcClient:
+    """Asks a running service for API responses
+
+    Speaks just enough HTTP over a plain socket that plugin invocations don't pay
+    for importing http.client. The server lives in resources.lib.ipcserver.
+    """
+
+    def __init__(self, address):
+        port, _, self.secret = address.partition(':')
+        self.port = int(port)
+
+    def get(self, endpoint, use_cache=True):
+        """Body the service fetched, or None if the server failed; OSError if the service can't be reached"""
+        query = urllib.parse.urlencode({'endpoint': endpoint, 'cache': '1' if use_cache else '0'})
+        request = (f'GET /api?{query} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                   f'X-Secret: {self.secret}\r\nConnection: close\r\n\r\n')
+        with socket.create_connection(('127.0.0.1', self.port), timeout=CLIENT_TIMEOUT) as sock:
+            sock.sendall(request.encode())
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+
+        head, sep, body = b''.join(chunks).partition(b'\r\n\r\n')
+        status_line, _, header_lines = head.partition(b'\r\n')
+        status = status_line.split(b' ', 2)[1:2]
+        if status == [b'502']:
+            # The service is up but its request to the server failed
+            return None
+        if not sep or status != [b'200']:
+            raise OSError(f'Service answered {status_line!r}')
+        for line in header_lines.split(b'\r\n'):
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length' and len(body) != int(value):
+                raise OSError('Connection to the service dropped mid-body')
+        return body
@@ -0,0 +1,56 @@
+import secrets
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class IpcHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if self.headers.get('X-Secret') != self.server.secret:
+            return self.reply(403, b'')
+        if url.path != '/api' or 'endpoint' not in query:
+            return self.reply(404, b'')
+
+        try:
+            body = self.server.fetch(query['endpoint'], query.get('cache') != '0')
+        except Exception:
+            body = None
+        if body is None:
+            return self.reply(502, b'')
+        self.reply(200, body)
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class IpcServer:
+    """Loopback HTTP endpoint through which plugin invocations use the service's session"""
+
+    def __init__(self, fetch):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), IpcHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fetch = fetch
+        self.httpd.secret = secrets.token_hex(16)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def address(self):
+        return f'{self.httpd.server_address[1]}:{self.httpd.secret}'
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,107 @@
+import json
+import os
+import sqlite3
+import time
+
+# Metadata fields the listings, search and widgets use; everything else is dropped
+METADATA_FIELDS = (
+    'title', 'subtitle', 'author', 'authorName', 'narratorName', 'seriesName',
+    'genres', 'description', 'publishedYear',
+)
+MEDIA_FIELDS = ('duration', 'numEpisodes', 'numTracks', 'numAudioFiles', 'numChapters')
+
+
+def compact_item(item):
+    """Strip a library listing entry down to the fields we render"""
+    media = item.get('media', {})
+    metadata = media.get('metadata', {})
+    compact_media = {key: media[key] for key in MEDIA_FIELDS if key in media}
+    compact_media['metadata'] = {key: metadata[key] for key in METADATA_FIELDS if metadata.get(key)}
+    compact = {
+        'id': item['id'],
+        'mediaType': item.get('mediaType'),
+        'addedAt': item.get('addedAt'),
+        'updatedAt': item.get('updatedAt'),
+        'media': compact_media,
+    }
+    return compact
+
+
+def get_sort_key(item):
+    title = item.get('media', {}).get('metadata', {}).get('title') or ''
+    return title.casefold()
+
+
+class LibraryMirror:
+    """Local copy of each library's item list, refreshed incrementally"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=5)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS items (
+            library_id TEXT NOT NULL,
+            item_id TEXT NOT NULL,
+            updated_at INTEGER,
+            sort_key TEXT NOT NULL,
+            item TEXT NOT NULL,
+            PRIMARY KEY (library_id, item_id))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS items_sort ON items (library_id, sort_key)')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS sync_state (
+            library_id TEXT PRIMARY KEY,
+            total INTEGER NOT NULL,
+            synced_at REAL NOT NULL,
+            full_synced_at REAL NOT NULL)''')
+        self.db.commit()
+
+    def get_state(self, library_id):
+        row = self.db.execute(
+            'SELECT total, synced_at, full_synced_at FROM sync_state WHERE library_id = ?', (library_id,)).fetchone()
+        if not row:
+            return None
+        return {'total': row[0], 'synced_at': row[1], 'full_synced_at': row[2]}
+
+    def set_state(self, library_id, total, full=False):
+        now = time.time()
+        state = self.get_state(library_id)
+        full_synced_at = now if full or not state else state['full_synced_at']
+        with self.db:
+            self.db.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?, ?)',
+                            (library_id, total, now, full_synced_at))
+
+    def get_watermark(self, library_id):
+        """Newest updatedAt we hold for the library"""
+        row = self.db.execute('SELECT MAX(updated_at) FROM items WHERE library_id = ?', (library_id,)).fetchone()
+        return row[0] or 0
+
+    def count(self, library_id):
+        return self.db.execute('SELECT COUNT(*) FROM items WHERE library_id = ?', (library_id,)).fetchone()[0]
+
+    def upsert(self, library_id, items):
+        """Store items (compacted) and return the compact versions"""
+        compact = [compact_item(item) for item in items if item.get('id')]
+        with self.db:
+            self.db.executemany(
+                'INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?)',
+                [(library_id, item['id'], item.get('updatedAt'), get_sort_key(item),
+                  json.dumps(item, separators=(',', ':'))) for item in compact])
+        return compact
+
+    def remove_missing(self, library_id, seen_ids):
+        """Delete items the server no longer lists and return their ids"""
+        held = {row[0] for row in self.db.execute('SELECT item_id FROM items WHERE library_id = ?', (library_id,))}
+        removed = list(held - set(seen_ids))
+        with self.db:
+            self.db.executemany('DELETE FROM items WHERE library_id = ? AND item_id = ?',
+                                [(library_id, item_id) for item_id in removed])
+        return removed
+
+    def get_page(self, library_id, page, page_size):
+        rows = self.db.execute(
+            'SELECT item FROM items WHERE library_id = ? ORDER BY sort_key, item_id LIMIT ? OFFSET ?',
+            (library_id, page_size, page * page_size))
+        return [json.loads(row[0]) for row in rows]
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM items')
+            self.db.execute('DELETE FROM sync_state')
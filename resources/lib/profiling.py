@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Spans that make up a route, in the order the summary lists them
+ROUTE_SPANS = ('network', 'json', 'build', 'render')
+
+# Request sources api_get_body counts, in summary order
+SOURCES = ('server', 'service', 'revalidated', 'cache', 'failed')
+
+# traces.jsonl is rotated to traces.jsonl.1 once it grows past this
+MAX_TRACE_BYTES = 2 * 1024 * 1024
+
+# Most cProfile dumps kept in the profile folder
+MAX_PROFILE_DUMPS = 20
+
+
+class Instrumentation:
+    """Timing spans, counters and (optionally) per-request events for one invocation
+
+    mark() closes a sequential phase (import, init, route); span() adds up a nested
+    one (network, json, build, render) that may run on several threads at once.
+    Events are only kept when keep_events is set, so a long-lived plugin in the
+    service doesn't grow without bound.
+    """
+
+    def __init__(self, started=None, keep_events=False):
+        self.started = self.last = started or time.perf_counter()
+        self.keep_events = keep_events
+        self.spans = {}
+        self.span_counts = {}
+        self.counters = {}
+        self.events = []
+        self.lock = threading.Lock()
+
+    def add(self, span, seconds):
+        with self.lock:
+            self.spans[span] = self.spans.get(span, 0) + seconds
+            self.span_counts[span] = self.span_counts.get(span, 0) + 1
+
+    def mark(self, phase):
+        """Attribute the time since the previous mark to phase"""
+        now = time.perf_counter()
+        self.add(phase, now - self.last)
+        self.last = now
+
+    @contextmanager
+    def span(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def event(self, kind, **fields):
+        if self.keep_events:
+            fields['kind'] = kind
+            fields['at_ms'] = round((time.perf_counter() - self.started) * 1000, 1)
+            with self.lock:
+                self.events.append(fields)
+
+    def ms(self, span):
+        return self.spans.get(span, 0) * 1000
+
+    def summary(self):
+        """One line: phases, route spans with call counts, request sources and totals"""
+        # Network time is summed over threads, so it can exceed the route's wall time
+        other = max(self.ms('route') - sum(self.ms(span) for span in ROUTE_SPANS), 0)
+        parts = [f'import {self.ms("import"):.1f} ms', f'init {self.ms("init"):.1f} ms']
+        parts += [f'{span} {self.ms(span):.1f} ms ({self.span_counts.get(span, 0)})' for span in ROUTE_SPANS]
+        parts.append(f'other {other:.1f} ms')
+        parts.append('requests ' + ' '.join(f'{source}={self.counters.get(source, 0)}' for source in SOURCES))
+        parts.append(f'{self.counters.get("bytes", 0) / 1024:.1f} KiB')
+        parts.append(f'{self.counters.get("items", 0)} items')
+        parts.append(f'total {(self.last - self.started) * 1000:.1f} ms')
+        return ', '.join(parts)
+
+    def record(self, **fields):
+        """Everything measured, as a dict for one line of traces.jsonl"""
+        fields.update({
+            'time': round(time.time(), 3),
+            'spans': {span: round(seconds * 1000, 1) for span, seconds in self.spans.items()},
+            'span_counts': self.span_counts,
+            'counters': self.counters,
+            'events': self.events,
+        })
+        return fields
+
+
+def append_trace(path, record):
+    """Append record to the JSONL file at path, rotating it when it gets large"""
+    try:
+        if os.path.getsize(path) > MAX_TRACE_BYTES:
+            os.replace(path, path + '.1')
+    except OSError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def profile_call(directory, name, func, *args):
+    """Run func under cProfile and dump the stats to directory/name-<time>.prof"""
+    import cProfile
+    os.makedirs(directory, exist_ok=True)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        profiler.dump_stats(os.path.join(directory, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}.prof'))
+        dumps = sorted((entry for entry in os.scandir(directory) if entry.name.endswith('.prof')),
+                       key=lambda entry: entry.stat().st_mtime)
+        for entry in dumps[:-MAX_PROFILE_DUMPS]:
+            os.remove(entry.path)
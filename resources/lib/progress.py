@@ -0,0 +1,132 @@
+import os
+import sqlite3
+import time
+
+
+class ProgressUpdate:
+    """Listening position of one book or podcast episode"""
+
+    __slots__ = ('item_id', 'episode_id', 'current_time', 'duration', 'is_finished', 'updated_at')
+
+    def __init__(self, item_id, episode_id, current_time, duration, is_finished=False, updated_at=None):
+        self.item_id = item_id
+        self.episode_id = episode_id
+        self.current_time = current_time
+        self.duration = duration
+        self.is_finished = is_finished
+        self.updated_at = updated_at or time.time()
+
+    @property
+    def key(self):
+        return self.item_id, self.episode_id
+
+    def to_json(self):
+        """Entry for PATCH /api/me/progress/batch/update"""
+        data = {
+            'libraryItemId': self.item_id,
+            'duration': self.duration,
+            'currentTime': self.current_time,
+            'progress': min(self.current_time / self.duration, 1) if self.duration else 0,
+            'isFinished': self.is_finished,
+        }
+        if self.episode_id:
+            data['episodeId'] = self.episode_id
+        return data
+
+
+class ProgressQueue:
+    """Progress updates the server hasn't accepted yet, one row per item or episode"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=5)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS progress (
+            item_id TEXT NOT NULL,
+            episode_id TEXT NOT NULL,
+            current_time REAL NOT NULL,
+            duration REAL NOT NULL,
+            is_finished INTEGER NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (item_id, episode_id))''')
+        self.db.commit()
+
+    def add(self, updates):
+        """Store updates, keeping only the newest one per item or episode"""
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO progress VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (item_id, episode_id) DO UPDATE SET current_time = excluded.current_time, '
+                'duration = excluded.duration, is_finished = excluded.is_finished, updated_at = excluded.updated_at '
+                'WHERE excluded.updated_at >= progress.updated_at',
+                [(u.item_id, u.episode_id or '', u.current_time, u.duration, int(u.is_finished), u.updated_at)
+                 for u in updates])
+
+    def get_all(self):
+        # Unquoted, current_time would be SQLite's CURRENT_TIME rather than the column
+        rows = self.db.execute(
+            'SELECT item_id, episode_id, "current_time", duration, is_finished, updated_at FROM progress')
+        return [ProgressUpdate(row[0], row[1] or None, row[2], row[3], bool(row[4]), row[5]) for row in rows]
+
+    def remove(self, updates):
+        """Drop rows the server accepted, unless a newer update has replaced them since"""
+        with self.db:
+            self.db.executemany(
+                'DELETE FROM progress WHERE item_id = ? AND episode_id = ? AND updated_at <= ?',
+                [(u.item_id, u.episode_id or '', u.updated_at) for u in updates])
+
+    def count(self):
+        return self.db.execute('SELECT COUNT(*) FROM progress').fetchone()[0]
+
+
+class ProgressSync:
+    """Coalesces position updates in memory and sends them in batches.
+
+    update() only overwrites the latest position per item, so calling it every
+    tick costs nothing on the wire; flush() sends everything pending (including
+    whatever an earlier outage left in the queue) in one request through send,
+    which returns True once the server accepted the batch.
+    """
+
+    def __init__(self, queue, send, interval=30):
+        self.queue = queue
+        self.send = send
+        self.interval = interval
+        self.pending = {}
+        # Last position recorded per item, so a paused player doesn't keep resending it
+        self.last = {}
+        self.next_flush = time.time() + interval
+        self.has_queued = queue.count() > 0
+
+    def update(self, item_id, episode_id, current_time, duration, is_finished=False):
+        update = ProgressUpdate(item_id, episode_id, current_time, duration, is_finished)
+        if self.last.get(update.key) == (current_time, is_finished):
+            return
+        self.last[update.key] = (current_time, is_finished)
+        self.pending[update.key] = update
+
+    def is_due(self):
+        return (self.pending or self.has_queued) and time.time() >= self.next_flush
+
+    def flush(self):
+        """Send pending and queued updates; returns True if nothing is left waiting"""
+        self.next_flush = time.time() + self.interval
+        updates = self.pending
+        self.pending = {}
+        if self.has_queued:
+            # Queued rows are older than anything seen since, so in-memory ones win
+            for update in self.queue.get_all():
+                updates.setdefault(update.key, update)
+        if not updates:
+            return True
+
+        batch = list(updates.values())
+        if self.send([update.to_json() for update in batch]):
+            if self.has_queued:
+                self.queue.remove(batch)
+                self.has_queued = False
+            return True
+
+        # Keep them on disk until the server is back; a later flush replays them
+        self.queue.add(batch)
+        self.has_queued = True
+        return False
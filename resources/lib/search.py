@@ -0,0 +1,121 @@
+import json
+import os
+import re
+import sqlite3
+
+from resources.lib.text import clean_html
+
+# Column weights for ranking: title, author, narrator, series, genres, description
+RANK_WEIGHTS = (10.0, 5.0, 3.0, 4.0, 2.0, 1.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class SearchIndex:
+    """Local full-text index over library item metadata, stored in SQLite FTS5"""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=5)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS docs (
+            rowid INTEGER PRIMARY KEY,
+            item_id TEXT UNIQUE NOT NULL,
+            library_id TEXT NOT NULL,
+            media_type TEXT NOT NULL,
+            updated_at INTEGER,
+            item TEXT NOT NULL)''')
+        try:
+            self.db.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+                title, author, narrator, series, genres, description,
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+            self.has_fts = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; fall back to substring matching
+            self.has_fts = False
+        self.db.commit()
+
+    def update(self, library_id, media_type, items):
+        """Add or refresh items; unchanged items (same updatedAt) are skipped"""
+        known = {}
+        ids = [item['id'] for item in items if item.get('id')]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self.db.execute(
+                f'SELECT item_id, rowid, updated_at FROM docs WHERE item_id IN ({",".join("?" * len(chunk))})', chunk)
+            known.update((item_id, (rowid, updated_at)) for item_id, rowid, updated_at in rows)
+
+        changed = 0
+        with self.db:
+            for item in items:
+                item_id = item.get('id')
+                if not item_id:
+                    continue
+                updated_at = item.get('updatedAt')
+                rowid, known_updated_at = known.get(item_id, (None, None))
+                if rowid is not None and updated_at is not None and updated_at == known_updated_at:
+                    continue
+
+                if rowid is not None:
+                    self.db.execute('DELETE FROM docs WHERE rowid = ?', (rowid,))
+                    if self.has_fts:
+                        self.db.execute('DELETE FROM docs_fts WHERE rowid = ?', (rowid,))
+                cursor = self.db.execute(
+                    'INSERT INTO docs (item_id, library_id, media_type, updated_at, item) VALUES (?, ?, ?, ?, ?)',
+                    (item_id, library_id, media_type, updated_at, json.dumps(item, separators=(',', ':'))))
+                if self.has_fts:
+                    self.db.execute(
+                        'INSERT INTO docs_fts (rowid, title, author, narrator, series, genres, description) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)', (cursor.lastrowid,) + self.get_fields(item))
+                changed += 1
+        return changed
+
+    def remove(self, item_ids):
+        with self.db:
+            for item_id in item_ids:
+                row = self.db.execute('SELECT rowid FROM docs WHERE item_id = ?', (item_id,)).fetchone()
+                if row:
+                    self.db.execute('DELETE FROM docs WHERE rowid = ?', row)
+                    if self.has_fts:
+                        self.db.execute('DELETE FROM docs_fts WHERE rowid = ?', row)
+
+    def search(self, query, limit=100):
+        """Return (media_type, item) pairs matching every word of query, best first"""
+        tokens = TOKEN_RE.findall(query)
+        if not tokens:
+            return []
+
+        if self.has_fts:
+            # Each word is a quoted prefix term, so user input can't inject FTS syntax
+            match = ' '.join('"%s"*' % token.replace('"', '""') for token in tokens)
+            rows = self.db.execute(
+                f'''SELECT docs.media_type, docs.item FROM docs_fts
+                    JOIN docs ON docs.rowid = docs_fts.rowid
+                    WHERE docs_fts MATCH ?
+                    ORDER BY bm25(docs_fts, {", ".join(map(str, RANK_WEIGHTS))})
+                    LIMIT ?''', (match, limit))
+        else:
+            where = ' AND '.join(['item LIKE ?'] * len(tokens))
+            rows = self.db.execute(
+                f'SELECT media_type, item FROM docs WHERE {where} LIMIT ?',
+                [f'%{token}%' for token in tokens] + [limit])
+        return [(media_type, json.loads(item)) for media_type, item in rows]
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM docs')
+            if self.has_fts:
+                self.db.execute('DELETE FROM docs_fts')
+
+    def get_fields(self, item):
+        metadata = item.get('media', {}).get('metadata', {})
+        series = metadata.get('seriesName') or ''
+        if not series and isinstance(metadata.get('series'), list):
+            series = ', '.join(s.get('name', '') for s in metadata['series'] if isinstance(s, dict))
+        return (
+            metadata.get('title') or '',
+            metadata.get('authorName') or metadata.get('author') or '',
+            metadata.get('narratorName') or '',
+            series,
+            ', '.join(metadata.get('genres') or []),
+            clean_html(metadata.get('description') or ''),
+        )
@@ -0,0 +1,154 @@
+import calendar
+import codecs
+import heapq
+import json
+import re
+import time
+
+# Read size for streamed responses
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\r\n'
+
+
+class JsonArrayStream:
+    """Yields the elements of one array inside a JSON document as they arrive.
+
+    Only the element being decoded is held in memory. Arrays under skip_keys are
+    discarded unread. Once iteration finishes, document holds the rest of the
+    JSON with those arrays (and the streamed one) left empty.
+    """
+
+    def __init__(self, chunks, key, skip_keys=()):
+        self.chunks = iter(chunks)
+        self.key = key
+        keys = '|'.join(re.escape(k) for k in (key,) + tuple(skip_keys))
+        self.key_re = re.compile(r'(?<!\\)"(%s)"\s*:\s*\[' % keys)
+        self.tail_size = max(len(k) for k in (key,) + tuple(skip_keys)) + 16
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.eof = False
+        self.document = None
+
+    def read_more(self):
+        if self.eof:
+            return False
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.buffer += self.decoder.decode(b'', final=True)
+            self.eof = True
+        else:
+            self.buffer += self.decoder.decode(chunk)
+        return True
+
+    def __iter__(self):
+        outside = []
+        while True:
+            match = self.key_re.search(self.buffer)
+            if not match:
+                # Keep only a tail in case a key is split across chunks
+                if len(self.buffer) > self.tail_size:
+                    outside.append(self.buffer[:-self.tail_size])
+                    self.buffer = self.buffer[-self.tail_size:]
+                if not self.read_more():
+                    break
+                continue
+
+            outside.append(self.buffer[:match.end()] + ']')
+            self.buffer = self.buffer[match.end():]
+            wanted = match.group(1) == self.key
+            for element in self.iter_elements():
+                if wanted:
+                    yield element
+
+        outside.append(self.buffer)
+        self.buffer = ''
+        self.document = json.loads(''.join(outside))
+
+    def iter_elements(self):
+        # Positioned just after '['; stops after consuming the matching ']'
+        pos = 0
+        while True:
+            while pos < len(self.buffer) and self.buffer[pos] in WHITESPACE + ',':
+                pos += 1
+            if pos >= len(self.buffer):
+                self.buffer = ''
+                pos = 0
+                if not self.read_more():
+                    raise ValueError('Unexpected end of JSON inside array')
+                continue
+            if self.buffer[pos] == ']':
+                self.buffer = self.buffer[pos + 1:]
+                return
+            try:
+                element, end = self.json_decoder.raw_decode(self.buffer, pos)
+            except json.JSONDecodeError:
+                # Most likely the element is cut off at the end of the buffer
+                self.buffer = self.buffer[pos:]
+                pos = 0
+                if not self.read_more():
+                    raise
+                continue
+            yield element
+            pos = end
+            if pos > CHUNK_SIZE:
+                self.buffer = self.buffer[pos:]
+                pos = 0
+
+
+class EpisodeRecord:
+    """The parts of a podcast episode the listing and playback routes use"""
+
+    __slots__ = ('id', 'title', 'description', 'published_at', 'duration', 'ino')
+
+    def __init__(self, id, title, description, published_at, duration, ino):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.published_at = published_at
+        self.duration = duration
+        self.ino = ino
+
+    @classmethod
+    def from_json(cls, ep):
+        audio_file = ep.get('audioFile') or {}
+        return cls(
+            ep.get('id', ep.get('episodeId', '')),
+            ep.get('title', ep.get('episodeTitle', 'Unknown Episode')),
+            ep.get('description', ep.get('subtitle', '')),
+            ep.get('publishedAt'),
+            ep.get('duration', audio_file.get('duration', 0)),
+            audio_file.get('ino'),
+        )
+
+    def to_json(self):
+        """Episode dict in the server's shape, for code that works on raw episodes"""
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'publishedAt': self.published_at,
+            'duration': self.duration,
+            'audioFile': {'ino': self.ino, 'duration': self.duration},
+        }
+
+
+def published_sort_key(published_at):
+    """publishedAt as epoch milliseconds, whether the server sent a number or an ISO string"""
+    if isinstance(published_at, (int, float)):
+        return published_at
+    if isinstance(published_at, str):
+        try:
+            return calendar.timegm(time.strptime(published_at[:19], '%Y-%m-%dT%H:%M:%S')) * 1000
+        except ValueError:
+            pass
+    return 0
+
+
+def select_newest(records, limit=None):
+    """Newest records first; with a limit only that many are ever kept in memory"""
+    key = lambda record: published_sort_key(record.published_at)
+    if limit:
+        return heapq.nlargest(limit, records, key=key)
+    return sorted(records, key=key, reverse=True)
@@ -0,0 +1,64 @@
+import html
+import re
+from functools import lru_cache
+from html.entities import html5
+
+# Every tag in one pass: script/style blocks are dropped, line-breaking tags become
+# newlines (group 1), anything else is removed. The leading '<' keeps the scan fast, and
+# the catch-all can't contain '<', so a stray one doesn't swallow the text up to the next tag.
+TAG_RE = re.compile(
+    r'<(?:(?i:script)[^>]*>.*?</(?i:script)>'
+    r'|(?i:style)[^>]*>.*?</(?i:style)>'
+    r'|((?i:br)\s*/?>|(?i:p|div)[^>]*>|/(?i:p|div)>)'
+    r'|[^<>]+>)',
+    re.DOTALL)
+
+# Same entity grammar as html.unescape
+ENTITY_RE = re.compile(r'&(?:#[0-9]+;?|#[xX][0-9a-fA-F]+;?|[^\t\n\f <&#;]{1,32};?)')
+
+BLANK_LINES_RE = re.compile(r'\n\s*\n')
+
+# Named entities, with the ones we render as plain ASCII instead of typographic characters
+ENTITIES = dict(html5)
+ENTITIES.update({
+    'nbsp;': ' ',
+    'hellip;': '...',
+    'ldquo;': '"',
+    'rdquo;': '"',
+    'lsquo;': "'",
+    'rsquo;': "'",
+})
+
+
+def _replace_tag(match):
+    return '' if match.lastindex is None else '\n'
+
+
+def _replace_entity(match):
+    entity = match.group()
+    char = ENTITIES.get(entity[1:])
+    if char is not None:
+        return char
+    char = html.unescape(entity)
+    # Kodi skins rarely have glyphs outside the BMP
+    return char if len(char) != 1 or ord(char) < 65536 else ''
+
+
+@lru_cache(maxsize=2048)
+def clean_html(text):
+    """Remove HTML tags and decode HTML entities"""
+    if not text:
+        return ''
+    if '<' in text:
+        text = TAG_RE.sub(_replace_tag, text)
+    if '&' in text:
+        text = ENTITY_RE.sub(_replace_entity, text)
+
+    # Blank-line runs become one empty line, space/tab runs a single space
+    if '\n' in text:
+        text = BLANK_LINES_RE.sub('\n\n', text)
+    if '\t' in text:
+        text = text.replace('\t', ' ')
+    while '  ' in text:
+        text = text.replace('  ', ' ')
+    return text.strip()
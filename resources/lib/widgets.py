@@ -0,0 +1,76 @@
+import json
+import os
+import time
+
+# (route kind, folder label, personalized shelf id) per widget, in the order the root lists them
+WIDGETS = (
+    ('in_progress', 'Continue Listening', 'continue-listening'),
+    ('recently_added', 'Recently Added', 'recently-added'),
+    ('newest_episodes', 'Newest Episodes', 'newest-episodes'),
+)
+
+# Entries kept per widget, which is also how many each library's shelves are asked for
+WIDGET_SIZE = 25
+
+# Without the service, a widget route rebuilds a snapshot older than this itself
+SNAPSHOT_MAX_AGE = 3600
+
+
+def trim_entity(entity):
+    """Just the parts of a shelf entity the widget listings render, so the snapshot stays small"""
+    media = entity.get('media', {})
+    metadata = media.get('metadata', {})
+    trimmed = {
+        'id': entity['id'],
+        'mediaType': entity.get('mediaType'),
+        'media': {
+            'metadata': {key: metadata[key] for key in ('title', 'authorName', 'narratorName', 'author', 'genres')
+                         if metadata.get(key)},
+            'duration': media.get('duration') or 0,
+            'numEpisodes': media.get('numEpisodes') or 0,
+        },
+    }
+    episode = entity.get('recentEpisode')
+    if episode:
+        audio_file = episode.get('audioFile') or {}
+        trimmed['recentEpisode'] = {
+            'id': episode.get('id'),
+            'title': episode.get('title'),
+            'publishedAt': episode.get('publishedAt'),
+            'duration': episode.get('duration', audio_file.get('duration', 0)),
+            'audioFile': {'ino': audio_file.get('ino')},
+        }
+    return trimmed
+
+
+def build_snapshot(shelves):
+    """Entries per widget from the shelves of every library's personalized response, newest first"""
+    from resources.lib.stream import published_sort_key
+    sort_keys = {
+        'in_progress': lambda entity: entity.get('progressLastUpdate') or 0,
+        'recently_added': lambda entity: entity.get('addedAt') or 0,
+        'newest_episodes': lambda entity: published_sort_key((entity.get('recentEpisode') or {}).get('publishedAt')),
+    }
+    widgets = {}
+    for kind, _, shelf_id in WIDGETS:
+        entities = [entity for shelf in shelves if shelf.get('id') == shelf_id for entity in shelf.get('entities', [])]
+        entities.sort(key=sort_keys[kind], reverse=True)
+        widgets[kind] = [trim_entity(entity) for entity in entities[:WIDGET_SIZE]]
+    return {'updated_at': time.time(), 'widgets': widgets}
+
+
+def load_snapshot(path):
+    """The last saved snapshot, or None if there is none yet"""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(path, snapshot):
+    """Replace the snapshot in one step, so a widget never reads half of it"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
@@ -0,0 +1,345 @@
+import json
+import os
+import time
+import urllib.parse as urlparse
+import xbmc
+import xbmcgui
+import xbmcaddon
+from main import AudiobookshelfPlugin
+from resources.lib.downloads import DownloadManager
+from resources.lib.ipc import DOWNLOADS_PROPERTY, NOW_PLAYING_PROPERTY, SERVICE_PROPERTY, WIDGETS_PROPERTY
+from resources.lib.ipcserver import IpcServer
+from resources.lib.progress import ProgressQueue, ProgressSync
+
+ADDON_ID = 'plugin.audio.audiobookshelf'
+
+# Seconds between refreshes of the library list and each library's first page
+PREFETCH_INTERVAL = 300
+
+# Seconds between widget snapshot refreshes; stopping playback also triggers one
+WIDGET_INTERVAL = 300
+
+# How often the highlighted list item is checked, in seconds
+HIGHLIGHT_POLL = 0.5
+
+# Largest jump in position between two polls still counted as listening time
+MAX_LISTEN_STEP = 2 * HIGHLIGHT_POLL + 1
+
+# Seconds a playback session may wait for its stream to start before it is closed unused
+SESSION_START_TIMEOUT = 60
+
+# Settings the addon writes itself (after a login, on the first session); they need no reconfiguring
+SELF_WRITTEN_SETTINGS = ('api_token', 'device_id')
+
+
+def get_setting_ids():
+    """Ids of the user-facing settings in resources/settings.xml"""
+    from xml.etree import ElementTree
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resources', 'settings.xml')
+    return [setting.get('id') for setting in ElementTree.parse(path).getroot().iter('setting')
+            if setting.get('type') != 'action' and setting.get('id') not in SELF_WRITTEN_SETTINGS]
+
+
+class ProgressMonitor(xbmc.Player):
+    """Reports listening progress for streams the plugin resolved.
+
+    Positions are sampled on every poll but only coalesced in a ProgressSync,
+    which sends them in batches every interval and right away on pause, stop
+    or end. Kodi calls the onPlayBack* callbacks on its own thread, so they
+    only queue events for poll() to handle.
+    """
+
+    def __init__(self, plugin, interval):
+        super().__init__()
+        self.plugin = plugin
+        self.window = xbmcgui.Window(10000)
+        self.sync = ProgressSync(ProgressQueue(os.path.join(plugin.profile_dir, 'progress.db')),
+                                 self.send, interval)
+        self.events = []
+        self.now_playing_raw = None
+        self.now_playing = None
+        # Now-playing record with a session whose stream hasn't been seen yet, and since when
+        self.unstarted = None
+        self.unstarted_at = 0
+        self.playing = None
+        self.position = 0
+        self.listened = 0
+        self.track_index = 0
+
+    def onAVStarted(self):
+        self.events.append('started')
+
+    def onPlayBackPaused(self):
+        self.events.append('paused')
+
+    def onPlayBackStopped(self):
+        self.events.append('stopped')
+
+    def onPlayBackEnded(self):
+        self.events.append('ended')
+
+    def send(self, batch):
+        return self.plugin.api_send('PATCH', '/me/progress/batch/update', batch) is not None
+
+    def get_now_playing(self):
+        raw = self.window.getProperty(NOW_PLAYING_PROPERTY)
+        if raw != self.now_playing_raw:
+            self.now_playing_raw = raw
+            # Replaced before its stream ever played, e.g. another item started first
+            self.close_unstarted()
+            try:
+                self.now_playing = json.loads(raw) if raw else None
+            except ValueError:
+                self.now_playing = None
+            if self.now_playing and self.now_playing.get('session_id'):
+                self.unstarted = self.now_playing
+                self.unstarted_at = time.time()
+        return self.now_playing
+
+    def close_unstarted(self):
+        """Close the session of a stream that never played, so its transcode doesn't keep running"""
+        if self.unstarted:
+            session_id = self.unstarted['session_id']
+            self.unstarted = None
+            self.plugin.api_post(f'/session/{session_id}/close')
+
+    def poll(self):
+        """Handle queued player events and sample the position; True once playback of ours stopped"""
+        self.get_now_playing()
+        if self.unstarted and time.time() - self.unstarted_at > SESSION_START_TIMEOUT:
+            # Kodi never opened the stream
+            self.close_unstarted()
+        if self.isPlayingAudio():
+            self.sample()
+        flush = stopped = False
+        while self.events:
+            event = self.events.pop(0)
+            if event == 'started':
+                self.sample()
+            elif self.playing and event in ('stopped', 'ended'):
+                self.finish(event == 'ended')
+                flush = stopped = True
+            elif event == 'paused':
+                flush = True
+        if flush or self.sync.is_due():
+            self.sync.flush()
+        return stopped
+
+    def sample(self):
+        """Record the position of the stream that is playing, if it is one of ours"""
+        try:
+            path = self.getPlayingFile().split('?')[0]
+            elapsed = self.getTime()
+        except RuntimeError:
+            # Playback ended between the check and the calls
+            return
+        now_playing = self.get_now_playing()
+        tracks = now_playing['tracks'] if now_playing else []
+        index = next((i for i, (url, _) in enumerate(tracks) if url == path), None)
+        if index is None:
+            if self.playing:
+                # Something else started; report where ours was left
+                self.finish(False)
+            return
+
+        if self.playing is not now_playing:
+            if self.playing:
+                self.finish(False)
+            self.playing = now_playing
+            if self.unstarted is now_playing:
+                # finish() closes it from here on
+                self.unstarted = None
+            self.position = tracks[index][1] + elapsed
+            self.listened = 0
+        position = tracks[index][1] + elapsed
+        if 0 < position - self.position <= MAX_LISTEN_STEP:
+            self.listened += position - self.position
+        self.position = position
+        self.track_index = index
+        self.sync.update(now_playing['item_id'], now_playing['episode_id'], position, now_playing['duration'])
+
+    def finish(self, ended):
+        """Final update for the item that was playing, closing its playback session if it had one"""
+        playing = self.playing
+        self.playing = None
+        duration = playing['duration']
+        finished = ended and self.track_index == len(playing['tracks']) - 1
+        position = duration if finished else self.position
+        self.sync.update(playing['item_id'], playing['episode_id'], position, duration, finished)
+        if playing.get('session_id'):
+            self.plugin.api_post(f'/session/{playing["session_id"]}/close', {
+                'currentTime': position, 'duration': duration, 'timeListened': self.listened})
+
+
+class AudiobookshelfService(xbmc.Monitor):
+    """Keeps a warm session and token for plugin invocations and prefetches likely next views"""
+
+    def __init__(self):
+        super().__init__()
+        self.window = xbmcgui.Window(10000)
+        self.plugin = None
+        self.ipc = None
+        self.progress = None
+        self.downloads = None
+        self.downloads_signal = None
+        self.next_prefetch = 0
+        self.next_widgets = 0
+        self.last_highlighted = None
+        self.settings_changed = True
+        self.setting_ids = get_setting_ids()
+        self.setting_values = None
+
+    def onSettingsChanged(self):
+        self.settings_changed = True
+
+    def configure(self):
+        """(Re)start everything for the current settings, unless only SELF_WRITTEN_SETTINGS changed"""
+        self.settings_changed = False
+        addon = xbmcaddon.Addon(ADDON_ID)
+        values = {key: addon.getSetting(key) for key in self.setting_ids}
+        if values == self.setting_values:
+            # A token refresh must not move the IPC port, stop downloads or reset playback monitoring.
+            # Pick up a token a plugin invocation got by logging in itself
+            if self.plugin:
+                self.plugin.token = addon.getSetting('api_token') or self.plugin.token
+            return
+        self.setting_values = values
+        self.stop_ipc()
+        self.stop_progress()
+        self.stop_downloads()
+        if addon.getSetting('service_enabled') == 'false' or not addon.getSetting('server_url'):
+            self.plugin = None
+            return
+        self.plugin = AudiobookshelfPlugin(handle=-1, use_service=False, quiet=True)
+        self.prefetch_enabled = addon.getSetting('service_prefetch') != 'false'
+        self.widgets_enabled = addon.getSetting('service_widgets') != 'false'
+        if addon.getSetting('sync_progress') != 'false':
+            try:
+                self.progress = ProgressMonitor(self.plugin, int(addon.getSetting('progress_interval') or 30))
+            except Exception as e:
+                xbmc.log(f'Audiobookshelf progress sync unavailable: {str(e)}', xbmc.LOGWARNING)
+        self.download_workers = int(addon.getSetting('download_workers') or 3)
+        self.download_rate = int(addon.getSetting('download_rate_limit') or 0) * 1024
+        # Picks up downloads a previous run left unfinished
+        self.start_downloads()
+        self.ipc = IpcServer(self.plugin.api_get_body)
+        self.ipc.start()
+        self.window.setProperty(SERVICE_PROPERTY, self.ipc.address)
+        self.next_prefetch = 0
+        self.next_widgets = 0
+
+    def stop_progress(self):
+        """Send what is still pending; anything the server doesn't take stays queued on disk"""
+        if self.progress:
+            try:
+                self.progress.sync.flush()
+            except Exception as e:
+                xbmc.log(f'Audiobookshelf progress sync error: {str(e)}', xbmc.LOGWARNING)
+            self.progress = None
+
+    def start_downloads(self):
+        """Work through queued downloads, once the plugin has queued any"""
+        if not self.downloads:
+            store = self.plugin.get_downloads(create=False)
+            if not store:
+                return
+            self.downloads = DownloadManager(store, self.plugin.fetch_range, self.download_workers, self.download_rate)
+        self.downloads.start()
+
+    def stop_downloads(self):
+        if self.downloads:
+            self.downloads.stop()
+            self.downloads = None
+
+    def stop_ipc(self):
+        self.window.clearProperty(SERVICE_PROPERTY)
+        if self.ipc:
+            self.ipc.stop()
+            self.ipc = None
+
+    def run(self):
+        while not self.abortRequested():
+            if self.settings_changed:
+                self.configure()
+            if self.plugin:
+                signal = self.window.getProperty(DOWNLOADS_PROPERTY)
+                if signal != self.downloads_signal:
+                    self.downloads_signal = signal
+                    self.start_downloads()
+            if self.progress:
+                try:
+                    if self.progress.poll():
+                        # Continue listening has changed
+                        self.next_widgets = 0
+                except Exception as e:
+                    xbmc.log(f'Audiobookshelf progress sync error: {str(e)}', xbmc.LOGWARNING)
+            if (self.plugin and self.widgets_enabled and self.plugin.is_configured
+                    and time.time() >= self.next_widgets):
+                self.next_widgets = time.time() + WIDGET_INTERVAL
+                try:
+                    self.refresh_widgets()
+                except Exception as e:
+                    xbmc.log(f'Audiobookshelf widget refresh error: {str(e)}', xbmc.LOGWARNING)
+            if self.plugin and self.prefetch_enabled and self.plugin.is_configured:
+                try:
+                    if time.time() >= self.next_prefetch:
+                        self.next_prefetch = time.time() + PREFETCH_INTERVAL
+                        self.prefetch_home()
+                    self.prefetch_highlighted()
+                except Exception as e:
+                    xbmc.log(f'Audiobookshelf prefetch error: {str(e)}', xbmc.LOGWARNING)
+            if self.waitForAbort(HIGHLIGHT_POLL):
+                break
+        self.stop_ipc()
+        self.stop_progress()
+        self.stop_downloads()
+
+    def refresh_widgets(self):
+        """Rebuild the widget snapshot, warm its covers and tell skins to reload the widgets"""
+        # The plugin is quiet, so a failed login here is only logged
+        if not self.plugin.login():
+            return
+        snapshot = self.plugin.refresh_widgets()
+        if not snapshot:
+            return
+        self.plugin.warm_covers([entry['id'] for entries in snapshot['widgets'].values() for entry in entries])
+        self.window.setProperty(WIDGETS_PROPERTY, str(int(snapshot['updated_at'])))
+
+    def prefetch_home(self):
+        """Warm the library list and the first page of each library"""
+        plugin = self.plugin
+        if not plugin.login():
+            return
+        data = plugin.api_get('/libraries')
+        if not data:
+            return
+        page_size = int(plugin.setting('page_size') or 100)
+        for lib in data.get('libraries', []):
+            media_type = lib.get('mediaType')
+            if media_type not in ('book', 'podcast'):
+                continue
+            if plugin.get_mirror():
+                plugin.sync_library(lib['id'], media_type)
+            else:
+                plugin.api_get(plugin.get_library_page_endpoint(lib['id'], 0, page_size))
+            if self.abortRequested():
+                return
+
+    def prefetch_highlighted(self):
+        """Load details for the item under the cursor in one of our listings"""
+        path = xbmc.getInfoLabel('ListItem.FolderPath') or xbmc.getInfoLabel('ListItem.FileNameAndPath')
+        if path == self.last_highlighted or not path.startswith(f'plugin://{ADDON_ID}/'):
+            return
+        self.last_highlighted = path
+        params = dict(urlparse.parse_qsl(urlparse.urlparse(path).query))
+        action = params.get('action')
+        if action == 'episodes' and params.get('id'):
+            self.plugin.get_podcast_index(params['id'])
+            self.plugin.warm_covers([params['id']], fanart=True)
+        elif action == 'play' and params.get('type', 'book') == 'book' and params.get('id'):
+            self.plugin.api_get(f'/items/{params["id"]}')
+            self.plugin.warm_covers([params['id']], fanart=True)
+
+
+if __name__ == '__main__':
+    AudiobookshelfService().run()